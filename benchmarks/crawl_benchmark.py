@@ -0,0 +1,203 @@
+"""Offline benchmark of the crawlers, against local stand-ins for the GitHub APIs and for a Maven repository.
+
+Each scenario runs crawler.py in a separate process (so that its peak memory can be measured), and reports
+the crawled items per second, the bytes served per second, the requests served by kind and the peak resident
+set size of the crawler process (commands executed by it and git processes are not included).
+
+Usage: python benchmarks/crawl_benchmark.py -h
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_servers import serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEASURE = os.path.join(ROOT, 'benchmarks', 'measure.py')
+
+SCENARIOS = ['github-zip', 'github-clone', 'mvn-rand', 'iterate']
+
+# iterate is measured on the files crawled by mvn-rand (listed in a file, one per line), executing a command on each one
+ITERATE_CODE = '''
+import sys
+import crawler
+with open(sys.argv[1]) as f:
+    files = list(crawler.crawled_files(line.rstrip('\\n') for line in f))
+crawler.iterate(sys.argv[2], 'all individual crawled files', files, jobs = int(sys.argv[3]))
+'''
+
+def server_stats(url):
+    parts = urllib.parse.urlsplit(url)
+    with urllib.request.urlopen(parts.scheme + '://' + parts.netloc + '/_stats') as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def stats_delta(before, after):
+    delta = { 'requests' : dict(), 'bytes' : 0 }
+    for kind, count in after['requests'].items():
+        if kind != 'stats' and count - before['requests'].get(kind, 0) > 0:
+            delta['requests'][kind] = count - before['requests'].get(kind, 0)
+    for kind, size in after['bytes'].items():
+        if kind != 'stats':
+            delta['bytes'] += size - before['bytes'].get(kind, 0)
+    return delta
+
+def completed_items(workdir):
+    # the last record of each path in the manifest tells whether it has been retrieved
+    records = dict()
+    manifest = os.path.join(workdir, 'crawl_manifest.jsonl')
+    if os.path.isfile(manifest):
+        with open(manifest) as f:
+            for line in f:
+                record = json.loads(line)
+                records[record['path']] = record['status']
+    return sorted(path for path, status in records.items() if status == 'complete')
+
+def run_measured(command, log):
+    """Runs a python script through measure.py, yielding its duration and peak memory.
+
+    Parameters:
+    - command: the script (or -c and code) and its arguments
+    - log:     the path of the file where the output of the script is written
+
+    Returns: pair of the duration, in seconds, and the peak resident set size, in KiB
+    """
+
+    rss_file = log + '.rss'
+    start = time.time()
+    with open(log, 'w') as output:
+        process = subprocess.run([sys.executable, MEASURE, rss_file] + command, cwd = ROOT, stdin = subprocess.DEVNULL,
+                                 stdout = output, stderr = subprocess.STDOUT)
+    duration = time.time() - start
+    if process.returncode != 0:
+        raise Exception('Benchmark process failed with exit code ' + str(process.returncode) + ', see ' + log)
+    with open(rss_file) as f:
+        return duration, int(f.read())
+
+def write_conf(path, sections):
+    with open(path, 'w') as f:
+        for section, entries in sections.items():
+            f.write('[' + section + ']\n')
+            for key, value in entries.items():
+                f.write(key + ' = ' + value + '\n')
+
+def crawl_scenario(args, urls, scratch, scenario):
+    workdir = os.path.join(scratch, scenario)
+    conf = os.path.join(scratch, scenario + '.conf')
+    if scenario.startswith('github'):
+        name, url = 'github', urls['github']
+        crawler = { 'user' : 'bench', 'token' : 'bench', 'clone' : str(scenario == 'github-clone').lower(),
+                    'zip' : str(scenario == 'github-zip').lower(), 'api_url' : url, 'web_url' : url }
+        write_conf(conf, { 'crawler' : crawler, 'query' : dict.fromkeys(['query', 'in', 'user', 'org', 'language', 'topic', 'license',
+                                                                         'fork', 'mirror', 'archived', 'followers', 'forks', 'stars',
+                                                                         'topics', 'created', 'pushed'], '') })
+    else:
+        name, url = 'mvn-rand', urls['maven']
+        write_conf(conf, { 'crawler' : { 'repository' : url, 'listing_cache' : 'false' } })
+
+    before = server_stats(url)
+    duration, rss = run_measured([os.path.join(ROOT, 'crawler.py'), name, '-c', conf, '-l', str(args.limit), '-d', workdir,
+                                  '-j', str(args.jobs)], os.path.join(scratch, scenario + '.log'))
+    delta = stats_delta(before, server_stats(url))
+    return { 'items' : len(completed_items(workdir)), 'bytes' : delta['bytes'], 'requests' : delta['requests'],
+             'seconds' : duration, 'peak_rss_kib' : rss }
+
+def iterate_scenario(args, urls, scratch):
+    workdir = os.path.join(scratch, 'mvn-rand')
+    if not os.path.isdir(workdir):
+        crawl_scenario(args, urls, scratch, 'mvn-rand')
+    # only the crawled jars: the manifest (or anything else in the workdir) would skew the measures
+    files = [os.path.join(workdir, path) for path in completed_items(workdir)]
+    size = sum(os.path.getsize(path) for path in files)
+    listing = os.path.join(scratch, 'iterate.files')
+    with open(listing, 'w') as f:
+        f.writelines(path + '\n' for path in files)
+
+    duration, rss = run_measured(['-c', ITERATE_CODE, listing, args.command, str(args.jobs)], os.path.join(scratch, 'iterate.log'))
+    return { 'items' : len(files), 'bytes' : size, 'requests' : dict(), 'seconds' : duration, 'peak_rss_kib' : rss }
+
+def report(name, result):
+    seconds = max(result['seconds'], 1e-9)
+    result['items_per_second'] = result['items'] / seconds
+    result['bytes_per_second'] = result['bytes'] / seconds
+    requests = ', '.join(kind + ': ' + str(count) for kind, count in sorted(result['requests'].items()))
+    print(name.ljust(14) + str(result['items']).rjust(6) + ' items  ' + ('%.1f' % result['items_per_second']).rjust(8) + ' items/s  ' +
+          ('%.2f' % (result['bytes_per_second'] / (1024 * 1024))).rjust(8) + ' MiB/s  ' +
+          ('%.1f' % (result['peak_rss_kib'] / 1024)).rjust(7) + ' MiB peak' + ('  (' + requests + ')' if requests else ''), flush = True)
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        if name in baseline:
+            expected = baseline[name]['items_per_second']
+            if result['items_per_second'] < expected * (1 - tolerance):
+                found.append(name + ': ' + ('%.1f' % result['items_per_second']) + ' items/s (baseline: ' + ('%.1f' % expected) + ')')
+    return found
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Offline benchmark of the crawlers, against local stand-ins for github and maven')
+    parser.add_argument('-s', '--scenarios', type = str, default = ','.join(SCENARIOS),
+                        help = 'comma-separated scenarios to run, among: ' + ', '.join(SCENARIOS) + ', defaults to all')
+    parser.add_argument('-l', '--limit', type = int, default = 100, help = 'maximum number of items crawled by each scenario, defaults to 100')
+    parser.add_argument('-j', '--jobs', type = int, default = 4, help = 'number of concurrent retrievals (and executions, for iterate), defaults to 4')
+    parser.add_argument('--repos', type = int, default = 2500,
+                        help = 'number of repositories matching the fake github search (more than 1000 requires partitioning), defaults to 2500')
+    parser.add_argument('--files', type = int, default = 20, help = 'number of files in each repository, zip file and jar, defaults to 20')
+    parser.add_argument('--file-size', type = int, default = 4096, help = 'size of each file in bytes, defaults to 4096')
+    parser.add_argument('--rate-limit', type = int, default = 1000, help = 'search requests allowed per minute by the fake github, defaults to 1000')
+    parser.add_argument('--depth', type = int, default = 4, help = 'depth of the fake maven directory tree, defaults to 4')
+    parser.add_argument('--breadth', type = int, default = 6, help = 'number of subdirectories of each fake maven directory, defaults to 6')
+    parser.add_argument('--command', type = str, default = 'true', help = 'command executed on each file by the iterate scenario, defaults to "true"')
+    parser.add_argument('-o', '--output', type = str, help = 'path of a json file where the results are written')
+    parser.add_argument('--baseline', type = str, help = 'path of the json results of a previous run: the benchmark fails if a scenario got slower')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown with respect to the --baseline, defaults to 0.2 (20%%)')
+    parser.add_argument('--keep', default = False, action = 'store_true', help = 'keep the working directories and logs of the scenarios')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise Exception('Unknown scenario: ' + scenario)
+
+    options = { 'repos' : args.repos, 'files' : args.files, 'file_size' : args.file_size, 'rate_limit' : args.rate_limit,
+                'depth' : args.depth, 'breadth' : args.breadth }
+    ready = multiprocessing.Queue()
+    servers = multiprocessing.Process(target = serve, args = (options, ready), daemon = True)
+    servers.start()
+    scratch = tempfile.mkdtemp(prefix = 'crawl-benchmark-')
+    results = dict()
+    try:
+        urls = ready.get(timeout = 60)
+        for scenario in scenarios:
+            if scenario == 'iterate':
+                results[scenario] = iterate_scenario(args, urls, scratch)
+            else:
+                results[scenario] = crawl_scenario(args, urls, scratch, scenario)
+            report(scenario, results[scenario])
+    finally:
+        servers.terminate()
+        servers.join()
+        if args.keep:
+            print('Working directories and logs kept in ' + scratch)
+        else:
+            shutil.rmtree(scratch, ignore_errors = True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print('Regression: ' + regression)
+        if found:
+            sys.exit(1)
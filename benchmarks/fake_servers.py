@@ -0,0 +1,343 @@
+import email.utils
+import hashlib
+import io
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawlers.github_search import parse_range, date_ordinal, ordinal_date
+
+class Counters:
+    def __init__(self):
+        """Creates the counters of the requests served by a fake server, by kind of request."""
+
+        self.requests = dict()
+        self.bytes = dict()
+        self.lock = threading.Lock()
+
+    def add(self, kind, size):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes[kind] = self.bytes.get(kind, 0) + size
+
+    def snapshot(self):
+        with self.lock:
+            return { 'requests' : dict(self.requests), 'bytes' : dict(self.bytes) }
+
+def make_zip(files, file_size):
+    """Builds a zip archive in memory, with the given number of (incompressible) files.
+
+    Parameters:
+    - files:     the number of files
+    - file_size: the size of each file, in bytes
+
+    Returns: the content of the archive
+    """
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for i in range(files):
+            archive.writestr('src/File' + str(i) + '.java', os.urandom(file_size))
+    return buffer.getvalue()
+
+def make_git_repo(root, files, file_size):
+    """Creates a bare git repository that can be served over the dumb HTTP protocol.
+
+    Parameters:
+    - root:      the directory where the repository is created
+    - files:     the number of files of the (single) commit
+    - file_size: the size of each file, in bytes
+
+    Returns: the path of the bare repository
+    """
+
+    work = os.path.join(root, 'work')
+    bare = os.path.join(root, 'repo.git')
+    os.makedirs(os.path.join(work, 'src'))
+    for i in range(files):
+        with open(os.path.join(work, 'src', 'File' + str(i) + '.java'), 'wb') as f:
+            f.write(os.urandom(file_size))
+
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost', '-c', 'init.defaultBranch=master']
+    subprocess.run(git + ['init', '-q', work], check = True)
+    subprocess.run(git + ['-C', work, 'add', '.'], check = True)
+    subprocess.run(git + ['-C', work, 'commit', '-q', '-m', 'benchmark'], check = True)
+    subprocess.run(git + ['clone', '-q', '--bare', work, bare], check = True)
+    # the dumb protocol needs the list of refs and packs as plain files
+    subprocess.run(git + ['-C', bare, 'update-server-info'], check = True)
+    shutil.rmtree(work)
+    return bare
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_content(self, kind, status, content, content_type, headers = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+        self.server.counters.add(kind, len(content))
+
+    def send_json(self, kind, status, value, headers = None):
+        self.send_content(kind, status, json.dumps(value).encode('utf-8'), 'application/json', headers)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/_stats':
+            return self.send_json('stats', 200, self.server.counters.snapshot())
+        try:
+            self.handle_path(path)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class FakeGitHub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, repos, zip_content, git_repo, rate_limit):
+        """Creates a local stand-in for the GitHub search APIs, zip archives and git repositories.
+
+        Repository i has (repos - i) stars and has been created i days after 2010-01-01, so that searches
+        can be partitioned on both qualifiers. All repositories share the same zip archive and the same git
+        repository, served over the dumb HTTP protocol (which does not support shallow clones).
+
+        Parameters:
+        - address:     pair of the host and port to listen on (port 0 picks a free port)
+        - repos:       the number of repositories
+        - zip_content: the content of the zip archive of each repository
+        - git_repo:    the path of the bare git repository served for each repository
+        - rate_limit:  the number of search requests allowed per minute
+        """
+
+        super().__init__(address, GitHubHandler)
+        self.repos = repos
+        self.zip_content = zip_content
+        self.git_repo = git_repo
+        self.rate_limit = rate_limit
+        self.window = (0, 0)
+        self.counters = Counters()
+        self.lock = threading.Lock()
+        self.base_url = 'http://' + address[0] + ':' + str(self.server_address[1])
+
+    def repository(self, i):
+        owner = 'owner' + str(i % 100)
+        full_name = owner + '/repo' + str(i)
+        return {
+            'id' : i,
+            'name' : 'repo' + str(i),
+            'full_name' : full_name,
+            'owner' : { 'login' : owner },
+            'stargazers_count' : self.repos - i,
+            'created_at' : ordinal_date(date_ordinal('2010-01-01') + i) + 'T00:00:00Z',
+            'clone_url' : self.base_url + '/git/' + full_name + '.git',
+            'html_url' : self.base_url + '/' + full_name,
+        }
+
+    def take(self):
+        # fixed windows of one minute, as the ones of the github search APIs
+        with self.lock:
+            start, used = self.window
+            now = time.time()
+            if now - start >= 60:
+                start, used = now, 0
+            allowed = used < self.rate_limit
+            if allowed:
+                used += 1
+            self.window = (start, used)
+            return allowed, self.rate_limit - used, int(start + 60)
+
+class GitHubHandler(FakeHandler):
+    def handle_path(self, path):
+        if path == '/search/repositories':
+            self.search()
+        elif path.startswith('/git/'):
+            self.git(path[len('/git/'):])
+        elif path.endswith('/archive/master.zip'):
+            self.send_content('zip', 200, self.server.zip_content, 'application/zip')
+        else:
+            self.send_content('other', 404, b'Not Found', 'text/plain')
+
+    def search(self):
+        allowed, remaining, reset = self.server.take()
+        headers = { 'X-RateLimit-Limit' : str(self.server.rate_limit), 'X-RateLimit-Remaining' : str(remaining), 'X-RateLimit-Reset' : str(reset) }
+        if not allowed:
+            return self.send_json('search', 403, { 'message' : 'API rate limit exceeded' }, headers)
+
+        params = parse_qs(urlsplit(self.path).query)
+        page = int(params.get('page', ['1'])[0])
+        per_page = min(100, int(params.get('per_page', ['30'])[0]))
+
+        # the repositories are sorted by stars: ranges on stars and creation dates are ranges of indices
+        low, high = 0, self.server.repos - 1
+        for term in params.get('q', [''])[0].split():
+            key, _, value = term.partition(':')
+            if key == 'stars':
+                bounds = parse_range(value, int) or (None, None)
+                if bounds[1] is not None:
+                    low = max(low, self.server.repos - bounds[1])
+                if bounds[0] is not None:
+                    high = min(high, self.server.repos - bounds[0])
+            elif key == 'created':
+                bounds = parse_range(value, date_ordinal) or (None, None)
+                if bounds[0] is not None:
+                    low = max(low, bounds[0] - date_ordinal('2010-01-01'))
+                if bounds[1] is not None:
+                    high = min(high, bounds[1] - date_ordinal('2010-01-01'))
+        total = max(0, high - low + 1)
+
+        # as github, only the first 1000 results can be paginated
+        first = low + (page - 1) * per_page
+        last = min(high + 1, first + per_page, low + 1000)
+        items = [self.server.repository(i) for i in range(first, last)]
+
+        last_page = max(1, (min(total, 1000) + per_page - 1) // per_page)
+        page_link = lambda number, rel : '<' + self.server.base_url + self.path.split('?')[0] + '?' + \
+            urlsplit(self.path).query.replace('page=' + str(page), 'page=' + str(number)) + '>; rel="' + rel + '"'
+        links = []
+        if page < last_page:
+            links.append(page_link(page + 1, 'next'))
+            links.append(page_link(last_page, 'last'))
+        if page > 1:
+            links.append(page_link(1, 'first'))
+            links.append(page_link(page - 1, 'prev'))
+        if links:
+            headers['Link'] = ', '.join(links)
+
+        self.send_json('search', 200, { 'total_count' : total, 'incomplete_results' : False, 'items' : items }, headers)
+
+    def git(self, path):
+        # <owner>/<repo>.git/<file of the repository>
+        parts = path.split('/', 2)
+        if len(parts) < 3 or '..' in parts[2].split('/'):
+            return self.send_content('git', 404, b'Not Found', 'text/plain')
+        full = os.path.join(self.server.git_repo, parts[2])
+        if not os.path.isfile(full):
+            return self.send_content('git', 404, b'Not Found', 'text/plain')
+        with open(full, 'rb') as f:
+            self.send_content('git', 200, f.read(), 'application/octet-stream')
+
+class FakeMaven(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, depth, breadth, jar_content):
+        """Creates a local stand-in for a Maven repository, serving directory listings in the format of Maven Central.
+
+        The repository is a tree of the given depth, where each directory has the given number of subdirectories
+        (the root also has org, com, net and io): the leaves are version directories, each one holding a jar, its
+        SHA-1 checksum, a pom and a sources jar.
+
+        Parameters:
+        - address:     pair of the host and port to listen on (port 0 picks a free port)
+        - depth:       the number of directory levels below the root
+        - breadth:     the number of subdirectories of each directory
+        - jar_content: the content of each jar
+        """
+
+        super().__init__(address, MavenHandler)
+        self.depth = depth
+        self.breadth = breadth
+        self.jar_content = jar_content
+        self.jar_sha1 = hashlib.sha1(jar_content).hexdigest().encode('ascii')
+        self.modified = email.utils.formatdate(time.time(), usegmt = True)
+        self.counters = Counters()
+        self.base_url = 'http://' + address[0] + ':' + str(self.server_address[1]) + '/maven2/'
+
+    def children(self, parts):
+        if len(parts) == self.depth:
+            artifact = parts[-2] if len(parts) > 1 else 'artifact'
+            name = artifact + '-' + parts[-1]
+            return [name + '.jar', name + '.jar.sha1', name + '.pom', name + '-sources.jar']
+        names = ['d' + str(i) + '/' for i in range(self.breadth)]
+        if not parts:
+            names = ['org/', 'com/', 'net/', 'io/'] + names[4:]
+        return names
+
+    def exists(self, parts):
+        if len(parts) > self.depth:
+            return False
+        for i, part in enumerate(parts):
+            if part + '/' not in self.children(parts[:i]):
+                return False
+        return True
+
+class MavenHandler(FakeHandler):
+    def handle_path(self, path):
+        if not path.startswith('/maven2/'):
+            return self.send_content('other', 404, b'Not Found', 'text/plain')
+
+        parts = [part for part in path[len('/maven2/'):].split('/') if part]
+        if path.endswith('/') or not parts:
+            return self.listing(parts)
+
+        directory, name = parts[:-1], parts[-1]
+        if not self.server.exists(directory) or len(directory) != self.server.depth or name not in self.server.children(directory):
+            return self.send_content('other', 404, b'Not Found', 'text/plain')
+        if name.endswith('.sha1'):
+            self.send_content('sha1', 200, self.server.jar_sha1, 'text/plain')
+        elif name.endswith('.jar'):
+            self.send_content('jar', 200, self.server.jar_content, 'application/java-archive')
+        else:
+            self.send_content('other', 200, b'<project/>', 'text/xml')
+
+    def listing(self, parts):
+        if not self.server.exists(parts):
+            return self.send_content('listing', 404, b'Not Found', 'text/plain')
+
+        # listings never change: conditional requests are always answered with 304
+        etag = '"' + hashlib.sha1('/'.join(parts).encode('utf-8')).hexdigest() + '"'
+        headers = { 'ETag' : etag, 'Last-Modified' : self.server.modified }
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.server.counters.add('listing', 0)
+            return
+
+        rows = ['<a href="../">../</a>']
+        for name in self.server.children(parts):
+            rows.append('<a href="' + name + '" title="' + name + '">' + name + '</a>' + ' ' * 20 + '2020-01-01 00:00         -')
+        html = '<html>\n<head><title>Central Repository: ' + '/'.join(parts) + '</title></head>\n<body>\n<pre id="contents">\n' + \
+            '\n'.join(rows) + '\n</pre>\n</body>\n</html>\n'
+        self.send_content('listing', 200, html.encode('utf-8'), 'text/html', headers)
+
+def serve(options, ready):
+    """Starts the fake servers, until the process is terminated.
+
+    Parameters:
+    - options: dictionary with the parameters of the servers (repos, files, file_size, rate_limit, depth, breadth)
+    - ready:   queue where the base urls of the servers are put once they are listening
+    """
+
+    # the servers are stopped by terminating their process: the scratch directory must still be removed
+    signal.signal(signal.SIGTERM, lambda signum, frame : sys.exit(0))
+    scratch = tempfile.mkdtemp(prefix = 'fake-servers-')
+    try:
+        content = make_zip(options['files'], options['file_size'])
+        git_repo = make_git_repo(scratch, options['files'], options['file_size'])
+        github = FakeGitHub(('127.0.0.1', 0), options['repos'], content, git_repo, options['rate_limit'])
+        maven = FakeMaven(('127.0.0.1', 0), options['depth'], options['breadth'], content)
+        threading.Thread(target = github.serve_forever, daemon = True).start()
+        ready.put({ 'github' : github.base_url, 'maven' : maven.base_url })
+        maven.serve_forever()
+    finally:
+        shutil.rmtree(scratch, ignore_errors = True)
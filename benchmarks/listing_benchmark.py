@@ -0,0 +1,74 @@
+"""Micro-benchmark of the parsing of Maven directory listings: the streaming href extractor used by mvn-rand
+against the BeautifulSoup (html.parser) parsing it replaced, on a synthetic listing in the format of Maven Central.
+
+Usage: python benchmarks/listing_benchmark.py -h
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawlers.mvn_rand import MvnRandom
+
+def make_listing(entries):
+    rows = ['<a href="../">../</a>']
+    for i in range(entries):
+        # mostly directories, as in group listings, with the files of a version directory mixed in
+        if i % 10 < 6:
+            name = 'artifact-' + str(i) + '/'
+        else:
+            name = 'artifact-' + str(i) + ['.jar', '-sources.jar', '-javadoc.jar', '.pom'][i % 4]
+        rows.append('<a href="' + name + '" title="' + name + '">' + name + '</a>' + ' ' * 40 + '2020-01-01 00:00      1234')
+    return ('<!DOCTYPE html>\n<html>\n<head>\n<title>Central Repository: org/example</title>\n</head>\n<body>\n<header><h1>org/example</h1></header>\n' +
+            '<main>\n<pre id="contents">\n' + '\n'.join(rows) + '\n</pre>\n</main>\n</body>\n</html>\n').encode('utf-8')
+
+def soup_links(page_url, content):
+    # the parsing previously performed by MvnRandom.parse_links
+    from bs4 import BeautifulSoup
+    result = []
+    for anchor in BeautifulSoup(content, features = 'html.parser').find_all('a', href = True):
+        link = anchor['href']
+        if link == '../' or link.endswith('-javadoc.jar') or link.endswith('-sources.jar'):
+            continue
+        if link.endswith('/') or link.endswith('.jar'):
+            result.append(page_url + link)
+    return result
+
+def chunked(content, size):
+    return (content[i:i + size] for i in range(0, len(content), size))
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Micro-benchmark of the parsing of Maven directory listings')
+    parser.add_argument('-n', '--entries', type = int, default = 20000, help = 'number of entries of the listing, defaults to 20000')
+    parser.add_argument('-r', '--repeat', type = int, default = 5, help = 'number of runs of each parser (the best one is reported), defaults to 5')
+    parser.add_argument('--chunk-size', type = int, default = 64 * 1024, help = 'size of the chunks the listing is streamed in, defaults to 65536')
+    args = parser.parse_args()
+
+    page_url = 'https://repo1.maven.org/maven2/org/example/'
+    content = make_listing(args.entries)
+    crawler = MvnRandom(1, '.', False)
+    print('Listing: ' + str(args.entries) + ' entries, ' + str(len(content)) + ' bytes', flush = True)
+
+    streaming, links = best_time(lambda : crawler.parse_links(page_url, chunked(content, args.chunk_size)), args.repeat)
+    print('streaming:     ' + ('%.2f' % (streaming * 1000)).rjust(9) + ' ms', flush = True)
+    try:
+        soup, expected = best_time(lambda : soup_links(page_url, content), args.repeat)
+    except ImportError:
+        print('BeautifulSoup is not installed: comparison skipped')
+        sys.exit(0)
+    print('BeautifulSoup: ' + ('%.2f' % (soup * 1000)).rjust(9) + ' ms (' + ('%.1f' % (soup / streaming)) + 'x slower)', flush = True)
+
+    if links != expected:
+        print('The parsers extracted different links')
+        sys.exit(1)
@@ -0,0 +1,33 @@
+"""Runs a python script (or code, with -c) and writes its peak resident set size, in KiB, to a file when it exits.
+
+Usage: python measure.py <output file> (<script> | -c <code>) [arguments...]
+"""
+
+import atexit
+import os
+import resource
+import runpy
+import sys
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def write_peak(path):
+    with open(path, 'w') as f:
+        f.write(str(peak_rss()))
+
+if __name__ == '__main__':
+    output = sys.argv[1]
+    atexit.register(write_peak, output)
+    if sys.argv[2] == '-c':
+        code = sys.argv[3]
+        sys.argv = ['-c'] + sys.argv[4:]
+        sys.path.insert(0, os.getcwd())
+        exec(compile(code, '<string>', 'exec'), { '__name__' : '__main__' })
+    else:
+        script = sys.argv[2]
+        sys.argv = sys.argv[2:]
+        sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+        runpy.run_path(script, run_name = '__main__')
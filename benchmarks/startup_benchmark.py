@@ -0,0 +1,66 @@
+"""Benchmark of the startup time of crawler.py: help, and template dumps of the built-in crawlers, that should not
+import the dependencies (requests, git, tqdm) needed only to crawl.
+
+Usage: python benchmarks/startup_benchmark.py -h
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRAWLER = os.path.join(ROOT, 'crawler.py')
+
+COMMANDS = {
+    'help' : ['-h'],
+    'github template' : ['github', '-t'],
+    'mvn-rand template' : ['mvn-rand', '-t'],
+}
+
+def run(arguments, importtime = False):
+    # each run dumps templates in a new workdir, so that it never prompts to overwrite them
+    workdir = tempfile.mkdtemp(prefix = 'startup-benchmark-')
+    try:
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [CRAWLER] + arguments
+        if arguments != ['-h']:
+            command += ['-d', workdir]
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd = workdir, stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            raise Exception('Command failed: ' + ' '.join(command) + '\n' + process.stderr.decode('utf-8', errors = 'replace'))
+        return elapsed, process.stderr.decode('utf-8', errors = 'replace')
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+def slowest_imports(report, count):
+    # lines of -X importtime: 'import time: <self us> | <cumulative us> | <indented module>'
+    imports = []
+    for line in report.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            module = parts[2].rstrip()
+            # only top level imports, since the cumulative time of nested ones is included
+            if not module.startswith('  '):
+                imports.append((int(parts[1]), module.strip()))
+    return sorted(imports, reverse = True)[:count]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark of the startup time of crawler.py')
+    parser.add_argument('-r', '--repeat', type = int, default = 10, help = 'number of runs of each command, defaults to 10')
+    parser.add_argument('--imports', type = int, default = 5,
+                        help = 'number of slowest top level imports reported for each command (measured through -X importtime), defaults to 5')
+    args = parser.parse_args()
+
+    for name, arguments in COMMANDS.items():
+        times = [run(arguments)[0] for _ in range(args.repeat)]
+        print(name.ljust(18) + ('%.1f' % (statistics.median(times) * 1000)).rjust(8) + ' ms (median), ' +
+              ('%.1f' % (min(times) * 1000)).rjust(8) + ' ms (best)', flush = True)
+        if args.imports:
+            for cumulative, module in slowest_imports(run(arguments, True)[1], args.imports):
+                print('    ' + module.ljust(30) + ('%.1f' % (cumulative / 1000)).rjust(8) + ' ms', flush = True)
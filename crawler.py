@@ -1,61 +1,281 @@
 import argparse
 import configparser
+import contextlib
 import os
 import fnmatch
+import hashlib
+import json
+import re
+import shlex
+import signal
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
-from crawlers.github import GitHubCrawler
-from crawlers.mvn_rand import MvnRandom
+from crawlers.archives import ArchiveMember, default_scratch, is_archive, iter_members
+from crawlers.result_cache import ResultCache
+from crawlers.sharding import parse_shard
+import crawlers.registry as registry
 
-def any_match(path, filters):
-    for f in filters:
-        if fnmatch.fnmatch(path, f):
-            return True
-    return False
+def compile_globs(globs):
+    # a single regular expression matching any of the globs, with the same case sensitivity of fnmatch.fnmatch
+    regex = re.compile('|'.join('(?:' + fnmatch.translate(os.path.normcase(glob)) + ')' for glob in globs))
+    return lambda path : regex.match(os.path.normcase(path)) is not None
     
 def normalize(path):
     return os.path.abspath(os.path.normpath(path))
    
-def execute(cmd, param):
+def quote(path):
+    if os.name == 'posix':
+        return shlex.quote(path)
+    return subprocess.list2cmdline([path])
+    
+def execute(cmd, params, timeout = None, capture = False, scratch = None, stdin = False):
+    with contextlib.ExitStack() as stack:
+        # archive members are passed to the command through temporary files, or through the standard input
+        if stdin:
+            if isinstance(params[0], ArchiveMember):
+                input = params[0].read()
+            else:
+                with open(params[0], 'rb') as f:
+                    input = f.read()
+            paths = params
+        else:
+            input = None
+            paths = [stack.enter_context(p.extracted(scratch)) if isinstance(p, ArchiveMember) else p for p in params]
+        return run(cmd, paths, timeout, capture, input)
+    
+def run(cmd, params, timeout, capture, input):
+    param = ' '.join(quote(p) for p in params)
     pos = cmd.find('{}')
     if pos == -1:
         full = cmd + ' ' + param
     else:
         full = cmd.replace('{}', param)
     print('- executing: ' + full, flush = True)
-    proc = subprocess.run(full)
-    return proc.returncode == 0
     
-def iterate(cmd, items_label, items, filtering = None):
-    print('Executing "' + cmd + '" on ' + items_label, flush = True) 
+    result = { 'command' : full, 'exit_code' : None }
+    start = time.time()
+    posix = os.name == 'posix'
+    try:
+        # on posix systems, a command line (and not just the name of an executable) is only accepted by the shell:
+        # the command gets its own process group, so that a timeout kills the shell along with its children
+        proc = subprocess.Popen(full, shell = posix, start_new_session = posix, 
+                                stdin = subprocess.PIPE if input is not None else None,
+                                stdout = subprocess.PIPE if capture else None, stderr = subprocess.STDOUT if capture else None)
+        try:
+            output, _ = proc.communicate(input = input, timeout = timeout)
+            result['exit_code'] = proc.returncode
+            result['status'] = 'succeeded' if proc.returncode == 0 else 'failed'
+        except subprocess.TimeoutExpired:
+            if posix:
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+            output, _ = proc.communicate()
+            print('- timed out: ' + full, flush = True)
+            result['status'] = 'timeout'
+        if capture:
+            # captured output is still shown
+            sys.stdout.buffer.write(output)
+            sys.stdout.flush()
+            result['output'] = output
+    except OSError as e:
+        print('- cannot execute: ' + full + ' (' + str(e) + ')', flush = True)
+        result['status'] = 'failed'
+    result['duration'] = time.time() - start
+    return result
+    
+def execute_cached(cmd, params, timeout, cache, force, capture, scratch, stdin):
+    # cached results are reused, and the command is executed only on the remaining items
+    results = []
+    digests = dict()
+    missing = []
+    for item in params:
+        if cache:
+            try:
+                digests[item] = cache.member_digest(item) if isinstance(item, ArchiveMember) else cache.content_digest(item)
+            except OSError:
+                # e.g. dangling symlinks or unreadable files: the command is still executed, but its result is not cached
+                digests[item] = None
+            cached = None if force or not digests[item] else cache.lookup(cmd, digests[item])
+            if cached:
+                print('- cached: ' + item + ' (exit code: ' + str(cached['exit_code']) + ')', flush = True)
+                if cached['output']:
+                    sys.stdout.buffer.write(cached['output'])
+                    sys.stdout.flush()
+                results.append((item, dict(cached, cached = True)))
+                continue
+        missing.append(item)
+        
+    if missing:
+        result = execute(cmd, missing, timeout, capture, scratch, stdin)
+        # a batch fails as a whole: its failure is not cached for each item, since other items might have caused it
+        cacheable = result['exit_code'] is not None if len(missing) == 1 else result['status'] == 'succeeded'
+        for item in missing:
+            results.append((item, result))
+            # timeouts and commands that could not be started might not happen again
+            if cache and cacheable and digests[item]:
+                # the output of a batch is not specific to the item, and it would be shown again for each one
+                cache.store(cmd, digests[item], result if len(missing) == 1 else dict(result, output = None))
+    return results
+    
+def crawled_results(crawler):
+    yield from crawler.iter_crawl()
+    print('Crawling completed', flush = True)
+    
+    if crawler.get_store():
+        report, duplicates = crawler.get_store().write_report()
+        print('Duplicated contents: ' + str(duplicates) + ' (report: ' + report + ')', flush = True)
+    
+def tree_identity(root):
+    # the relative paths and inodes of all the files of a directory, except for the ones in version control 
+    # directories: deduplicated trees (e.g. forks, or vendored copies) have the same identity
+    files = []
+    for dirpath, subdirs, filelist in os.walk(root):
+        subdirs[:] = [d for d in subdirs if d not in ('.git', '.hg', '.svn', '.bzr')]
+        for name in filelist:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                files.append((os.path.relpath(path, root), os.readlink(path)))
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((os.path.relpath(path, root), stat.st_dev, stat.st_ino))
+    return hashlib.sha256(repr(sorted(files)).encode('utf-8', errors = 'surrogateescape')).hexdigest()
+    
+def unique_contents(items):
+    # deduplicated files are hardlinks to the same blob: they are identified by their inode, without hashing them
+    seen = set()
+    for item in items:
+        if os.path.isfile(item):
+            stat = os.stat(item)
+            identity = (stat.st_dev, stat.st_ino)
+        elif os.path.isdir(item):
+            identity = tree_identity(item)
+        else:
+            identity = None
+        if identity is not None:
+            if identity in seen:
+                continue
+            seen.add(identity)
+        yield item
+    
+def walk_files(root, matches, prune):
+    # directories are scanned lazily, one at a time, skipping the pruned ones (and their whole content)
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks = False):
+                    if not prune(entry.name):
+                        stack.append(entry.path)
+                elif entry.is_dir():
+                    # links to directories are not followed, like os.walk does
+                    continue
+                elif not matches or matches(entry.path):
+                    yield entry.path
+    
+def crawled_files(crawled_results, matches = None, prune = lambda name : False, archives = False, unique = False):
+    # with archives, matching is performed on their members: archives themselves are always selected
+    selects = matches
+    if archives and matches:
+        selects = lambda path : is_archive(path) or matches(path)
+    
+    def selected_files():
+        for crawled in crawled_results:
+            crawled = normalize(crawled)
+            if os.path.isdir(crawled):
+                yield from walk_files(crawled, selects, prune)
+            elif not selects or selects(crawled):
+                yield crawled
+    
+    files = selected_files()
+    if unique:
+        # duplicates are skipped before archives are expanded, since their members are not files on disk
+        files = unique_contents(files)
+    for path in files:
+        if archives and is_archive(path):
+            # members are listed lazily, archive by archive, and extracted only when executing on them
+            yield from iter_members(path, matches, prune)
+        else:
+            yield path
     
-    runs = 0
-    succeeded = 0
-    failed = 0
+def batches(items, filtering, size):
+    batch = []
     for item in items:
         if not filtering or filtering(item):
-            if execute(cmd, normalize(item)):
-                succeeded += 1
-            else:
-                failed += 1
-            runs += 1
-    print('Execution completed (runs: ' + str(runs) + ', succeeded: ' + str(succeeded) + ', failed: ' + str(failed) + ')', flush = True)
+            batch.append(item if isinstance(item, ArchiveMember) else normalize(item))
+            if len(batch) == size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
     
-if __name__ == "__main__":
+def iterate(cmd, items_label, items, filtering = None, jobs = 1, timeout = None, batch = 1, log = None, cache = None, force = False, capture = False, 
+            scratch = None, stdin = False, metrics = None):
+    print('Executing "' + cmd + '" on ' + items_label, flush = True) 
     
-    crawlers = {
-        'github' : lambda limit, workdir, skip_existing : GitHubCrawler(limit, workdir, skip_existing),
-        'mvn-rand' : lambda limit, workdir, skip_existing : MvnRandom(limit, workdir, skip_existing),
-    }
+    counts = { 'succeeded' : 0, 'failed' : 0, 'timeout' : 0, 'cached' : 0 }
+    log_file = open(log, 'a') if log else None
+    start = time.time()
+    
+    def record(results):
+        executions = []
+        for item, result in results:
+            if result.get('cached'):
+                counts['cached'] += 1
+            elif not any(result is execution for execution in executions):
+                # items passed together to the same command share its result
+                executions.append(result)
+                counts[result['status']] += 1
+                if metrics:
+                    metrics.observe('exec_seconds', result['duration'], status = result['status'])
+        if metrics:
+            metrics.increment('exec_items', len(results))
+        if log_file:
+            # one entry for each item, even if it has been passed to the command together with other ones
+            for item, result in results:
+                entry = dict(result, item = item, batch = len(results))
+                entry.pop('output', None)
+                log_file.write(json.dumps(entry) + '\n')
+            log_file.flush()
+    
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, jobs)) as executor:
+            # items are streamed: only a bounded number of commands is submitted ahead of the running ones
+            pending = set()
+            for params in batches(items, filtering, max(1, batch)):
+                pending.add(executor.submit(execute_cached, cmd, params, timeout, cache, force, capture, scratch, stdin))
+                if len(pending) >= 2 * jobs:
+                    done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+            for future in as_completed(pending):
+                record(future.result())
+    finally:
+        if log_file:
+            log_file.close()
+        if cache:
+            cache.evict()
+        if metrics:
+            metrics.observe('stage_seconds', time.time() - start, stage = 'exec')
+            metrics.increment('exec_cache', counts['cached'], result = 'hit')
+            
+    runs = counts['succeeded'] + counts['failed'] + counts['timeout']
+    print('Execution completed (runs: ' + str(runs) + ', succeeded: ' + str(counts['succeeded']) + ', failed: ' + str(counts['failed']) + ', timed out: ' + str(counts['timeout']) + ', cached: ' + str(counts['cached']) + ')', flush = True)
+    
+if __name__ == "__main__":
     
-    available_crawlers = crawlers.keys()
-
     parser = argparse.ArgumentParser(description = 'Code crawler: retrieveing code for constructing test sets')
     parser.add_argument('crawler', 
                         metavar = 'crawler', 
                         type = str, 
-                        help = 'the name of the crawler, one of: ' + ', '.join(available_crawlers), 
-                        choices = available_crawlers
+                        help = 'the name of the crawler: one of the built-in ones (' + ', '.join(registry.CRAWLERS) + '), one provided by an installed package through the "' + registry.ENTRY_POINT_GROUP + '" entry points, or a module:class reference to a subclass of crawlers.base_crawler.Crawler'
                         )
     parser.add_argument("-c", 
                         "--config", 
@@ -81,9 +301,58 @@ if __name__ == "__main__":
     parser.add_argument("-s", 
                         "--skip-existing", 
                         default = False, 
-                        help = "when retrieving a crawled result, skip the retrieval it if it already exists in the workdir, but still consider it a crawled item (useful to avoid retrieving the same item in subsequent executions)", 
+                        help = "when retrieving a crawled result, skip the retrieval it if it has already been completely retrieved in the workdir (according to the crawl manifest in <workdir>/crawl_manifest.jsonl), but still consider it a crawled item (useful to avoid retrieving the same item in subsequent executions, or to resume an interrupted execution)", 
                         action = 'store_true'
                         )
+    parser.add_argument("-j", 
+                        "--jobs", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of results retrieved concurrently, defaults to 1", 
+                        default = 1
+                        )
+    parser.add_argument("-p", 
+                        "--prefetch", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of crawled results retrieved ahead of the ones being processed by --exec or --fexec, on top of the ones being retrieved, defaults to 2", 
+                        default = 2
+                        )
+    parser.add_argument("--shard", 
+                        metavar = 'i/N', 
+                        type = str, 
+                        help = "crawl only the i-th of N disjoint shards (0 <= i < N), to split a crawl among N nodes running the same command: items are assigned to shards by a stable hash (github) or sampled by each shard (mvn-rand, that needs a --seed)", 
+                        default = None
+                        )
+    parser.add_argument("--seed", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "seed of random choices (e.g. of mvn-rand), to make a crawl reproducible", 
+                        default = None
+                        )
+    parser.add_argument("--merge-manifests", 
+                        default = False, 
+                        help = "instead of executing, merge the manifests of all the shards found in the working directory (e.g. after collecting there the items crawled by all nodes) into a single manifest", 
+                        action = 'store_true'
+                        )
+    parser.add_argument("--http-timeout", 
+                        metavar = 'seconds', 
+                        type = float, 
+                        help = "time after which an HTTP connection that is not sending data is dropped, defaults to 60", 
+                        default = 60
+                        )
+    parser.add_argument("--http-retries", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of times an HTTP request failing because of connection or server errors is retried, defaults to 3", 
+                        default = 3
+                        )
+    parser.add_argument("--http-pool", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of HTTP connections kept open to the same host, defaults to the number of jobs (at least 10)", 
+                        default = None
+                        )
     parser.add_argument("-t", 
                         "--config-template", 
                         help = "instead of executing, dump the configuration template for the given crawler to <workdir>/crawler.conf.template",
@@ -94,9 +363,15 @@ if __name__ == "__main__":
                         "--filter-files", 
                         metavar = 'filter',
                         type = str,
-                        help = "comma separated list of globs (fnmatch style) for filtering crawled files in each crawled result for subsequent --fexec (if no --fexec is provided, this option is useless) - wrap them in double quotes to avoid glob expansion in your terminal",
+                        help = "comma separated list of globs (fnmatch style) for filtering crawled files in each crawled result for subsequent --fexec (if no --fexec is provided, this option is only used by crawlers that can retrieve matching files only, e.g. github with sparse checkout) - wrap them in double quotes to avoid glob expansion in your terminal",
                         default = "",
                         )
+    parser.add_argument("--prune-dirs", 
+                        metavar = 'filter',
+                        type = str,
+                        help = "comma separated list of globs (fnmatch style) for the names of directories whose content is ignored when looking for files for --fexec, defaults to '.git,.hg,.svn,.bzr' - pass an empty string to visit all directories",
+                        default = ".git,.hg,.svn,.bzr",
+                        )
     parser.add_argument("-e", 
                         "--exec", 
                         metavar = 'command',
@@ -111,16 +386,107 @@ if __name__ == "__main__":
                         help = "command to execute on each file (optionally filtered with --filter-files) inside each crawled result; absolute path to the result - file or folder - will be replaced to all occurrences of '{}', or appendend at the end of the command if no occurrence is found",
                         default = "",
                         )
+    parser.add_argument("--store", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "path to a content-addressed store (on the same file system of the workdir) where crawled files are deduplicated through hardlinks, and where a report of the duplicated contents is written", 
+                        default = None
+                        )
+    parser.add_argument("--skip-duplicates", 
+                        default = False, 
+                        help = "execute --exec or --fexec only once for files with the same content (i.e., hardlinks to the same file, as deduplicated by --store), and --exec only once for directories with the same files (e.g. forks)", 
+                        action = 'store_true'
+                        )
+    parser.add_argument("--fexec-archives", 
+                        default = False, 
+                        help = "execute --fexec on each member (optionally filtered with --filter-files) of the zip-based archives (zip, jar, war, ear, aar) among the crawled files, instead of on the archives themselves: members are extracted to temporary files only while executing on them", 
+                        action = 'store_true'
+                        )
+    parser.add_argument("--fexec-stdin", 
+                        default = False, 
+                        help = "with --fexec-archives, pass each archive member to --fexec through the standard input instead of a temporary file: '{}' is replaced by '<archive>!/<member>'", 
+                        action = 'store_true'
+                        )
+    parser.add_argument("--scratch", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "directory for the temporary files of --fexec-archives, defaults to /dev/shm (if available) or to the system temporary directory", 
+                        default = None
+                        )
+    parser.add_argument("--exec-jobs", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of --exec or --fexec commands running concurrently, defaults to 1", 
+                        default = 1
+                        )
+    parser.add_argument("--exec-timeout", 
+                        metavar = 'seconds', 
+                        type = float, 
+                        help = "time after which a running --exec or --fexec command is killed and considered timed out, defaults to no timeout", 
+                        default = None
+                        )
+    parser.add_argument("--exec-batch", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of paths passed to a single --exec or --fexec command, separated by spaces (like xargs), defaults to 1", 
+                        default = 1
+                        )
+    parser.add_argument("--exec-log", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "file where the result (command, exit code, status and duration) of --exec or --fexec on each item is appended, in json lines format", 
+                        default = None
+                        )
+    parser.add_argument("--exec-cache", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "database where the results of --exec or --fexec are cached, keyed by the command and the checksum of the content of the item: the command is not executed again on items whose content did not change", 
+                        default = None
+                        )
+    parser.add_argument("--exec-cache-size", 
+                        metavar = 'n', 
+                        type = int, 
+                        help = "maximum number of results kept in the --exec-cache, evicting the least recently used ones, defaults to 1000000", 
+                        default = 1000000
+                        )
+    parser.add_argument("--exec-cache-output", 
+                        default = False, 
+                        help = "capture the output of --exec or --fexec commands and store it in the --exec-cache, to show it again when a cached result is used (only for commands executed on a single item: with --exec-batch, only successful results are cached, without output)", 
+                        action = 'store_true'
+                        )
+    parser.add_argument("--force-exec", 
+                        default = False, 
+                        help = "execute --exec or --fexec commands even if their result is in the --exec-cache, replacing it", 
+                        action = 'store_true'
+                        )
+    
+    parser.add_argument("--metrics-json", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "path of a json file where the metrics of the run (durations of stages and items, HTTP requests, bytes, cache hits and retries) are written at the end", 
+                        default = None
+                        )
+    parser.add_argument("--metrics-prom", 
+                        metavar = 'path', 
+                        type = str, 
+                        help = "path of a file where the metrics of the run are written at the end in the Prometheus text format (e.g. for the textfile collector of the node exporter)", 
+                        default = None
+                        )
     
     args = parser.parse_args()
     
-    if not args.crawler in available_crawlers:
-        raise Exception('Unknown crawler: ' + action)
-        
-    crawler = crawlers[args.crawler](args.limit, args.workdir, args.skip_existing)
+    crawler = registry.load(args.crawler)(args.limit, args.workdir, args.skip_existing, jobs = args.jobs, prefetch = args.prefetch, 
+                                     http_timeout = args.http_timeout, http_retries = args.http_retries, http_pool = args.http_pool,
+                                     file_filters = args.filter_files.split(',') if args.filter_files else [], store_root = args.store,
+                                     shard = parse_shard(args.shard) if args.shard else None, seed = args.seed)
+    
+    if args.merge_manifests:
+        merged, items = crawler.merge_manifests()
+        print('Merged manifests: ' + str(merged) + ' (items: ' + str(items) + ')')
+        exit()
 
     if args.config_template:
-        if crawler.requires_config():
+        if crawler.supports_config():
             template_loc = crawler.dump_conf_template()
             print('Configuration template dumped to: ' + template_loc)
         else:
@@ -134,24 +500,48 @@ if __name__ == "__main__":
             crawler.read_conf(config)
         else:
             raise Exception(args.config + ' does not exist')
+    elif crawler.supports_config() and os.path.isfile(args.config):
+        # optional configuration
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        crawler.read_conf(config)
         
-    result = crawler.crawl()
+    if args.exec or args.fexec:
+        # commands are executed while the crawling is still in progress: live progress of 
+        # the retrievals would interleave with the output of the commands
+        crawler.live_progress = False
+    result = crawled_results(crawler)
     
-    print('Crawling completed', flush = True) 
-    
-    if args.exec:
-        iterate(args.exec, 'all clrawled result', result)
-    elif args.fexec:
-        files = []
-        for crawled in result:
-            if os.path.isdir(crawled):
-                for dirpath, subdirs, filelist in os.walk(crawled):
-                    for name in filelist:
-                        files.append(normalize(os.path.join(dirpath, name)))
-            else: 
-                files.append(normalize(crawled))
-        if args.filter_files:
-            filters = args.filter_files.split(',')
-            iterate(args.fexec, 'individual clrawled files that match one of "' + str(filters) + '"', files, lambda item : any_match(item, filters))
+    exec_options = { 'jobs' : args.exec_jobs, 'timeout' : args.exec_timeout, 'batch' : args.exec_batch, 'log' : args.exec_log,
+                     'cache' : ResultCache(args.exec_cache, args.exec_cache_size) if args.exec_cache else None, 
+                     'force' : args.force_exec, 'capture' : args.exec_cache_output, 'metrics' : crawler.metrics }
+    if args.fexec_stdin and args.exec_batch > 1:
+        raise Exception('--fexec-stdin passes a single archive member at a time: it cannot be used with --exec-batch')
+    try:
+        if args.exec:
+            if args.skip_duplicates:
+                result = unique_contents(result)
+            iterate(args.exec, 'all clrawled result', result, **exec_options)
+        elif args.fexec:
+            prune = compile_globs(args.prune_dirs.split(',')) if args.prune_dirs else lambda name : False
+            filters = args.filter_files.split(',') if args.filter_files else []
+            files = crawled_files(result, compile_globs(filters) if filters else None, prune, args.fexec_archives, args.skip_duplicates)
+            if args.fexec_archives:
+                exec_options['scratch'] = args.scratch or default_scratch()
+                exec_options['stdin'] = args.fexec_stdin
+            if filters:
+                iterate(args.fexec, 'individual clrawled files that match one of "' + str(filters) + '"', files, **exec_options)
+            else:
+                iterate(args.fexec, 'all individual clrawled files', files, **exec_options)
         else:
-            iterate(args.fexec, 'all individual clrawled files', files)
+            for crawled in result:
+                pass
+    finally:
+        # metrics are written even if the run is interrupted
+        if args.metrics_json:
+            crawler.metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            crawler.metrics.write_prometheus(args.metrics_prom, crawler = args.crawler)
+        if exec_options['cache']:
+            exec_options['cache'].close()
+        crawler.close()
@@ -0,0 +1,135 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+# extensions of the zip-based archives whose members can be processed individually
+ARCHIVE_EXTENSIONS = ('.zip', '.jar', '.war', '.ear', '.aar')
+
+def is_archive(path):
+    """Yields whether the file at the given path is an archive whose members can be processed individually.
+
+    Parameters:
+    - path: the path of the file
+
+    Returns: True if the file is a (zip-based) archive, False otherwise
+    """
+
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and zipfile.is_zipfile(path)
+
+def default_scratch():
+    """Yields the default directory for temporary files holding extracted archive members: a memory-backed
+    file system if available (/dev/shm), the default temporary directory otherwise.
+
+    Returns: the path of the directory
+    """
+
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+class SharedArchive:
+    def __init__(self, path):
+        """Opens an archive once for all its members, so that its central directory is parsed only once.
+
+        Members can be read concurrently: the archive is closed when no member refers to it anymore.
+
+        Parameters:
+        - path: the path of the archive
+        """
+
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.lock = threading.Lock()
+
+    def open(self, info):
+        # readers of a zip file share its handle, seeking under its own lock
+        with self.lock:
+            return self.zip.open(info)
+
+# a member of an archive, represented by the string '<archive path>!/<member name>'
+class ArchiveMember(str):
+    def __new__(cls, archive, name, shared = None, info = None):
+        member = super().__new__(cls, archive + '!/' + name)
+        member.archive = archive
+        member.name = name
+        # the archive opened by iter_members, and the entry of the member in its central directory
+        member.shared = shared
+        member.info = info
+        return member
+
+    @contextlib.contextmanager
+    def open(self):
+        """Opens the member for reading.
+
+        Returns: a binary stream with the content of the member
+        """
+
+        if self.shared:
+            with self.shared.open(self.info or self.name) as stream:
+                yield stream
+        else:
+            with zipfile.ZipFile(self.archive) as archive, archive.open(self.name) as stream:
+                yield stream
+
+    def read(self):
+        with self.open() as stream:
+            return stream.read()
+
+    def digest(self):
+        """Computes the SHA-256 checksum of the content of the member.
+
+        Returns: the checksum, as a lowercase hex string
+        """
+
+        digest = hashlib.sha256()
+        with self.open() as stream:
+            for data in iter(lambda : stream.read(1024 * 1024), b''):
+                digest.update(data)
+        return digest.hexdigest()
+
+    @contextlib.contextmanager
+    def extracted(self, scratch):
+        """Extracts the member to a temporary file, that is deleted when the context is exited.
+
+        The temporary file keeps the name of the member, for commands that depend on it (e.g. on its extension).
+
+        Parameters:
+        - scratch: the directory where the temporary file is created
+
+        Returns: the path of the temporary file
+        """
+
+        directory = tempfile.mkdtemp(dir = scratch)
+        try:
+            target = os.path.join(directory, os.path.basename(self.name))
+            with self.open() as source, open(target, 'wb') as handle:
+                shutil.copyfileobj(source, handle, 1024 * 1024)
+            yield target
+        finally:
+            shutil.rmtree(directory, ignore_errors = True)
+
+def iter_members(archive, matches = None, prune = lambda name : False):
+    """Lists the members of an archive, without extracting them.
+
+    Parameters:
+    - archive: the path of the archive
+    - matches: function selecting the members to list, given their string representation
+    - prune:   function selecting the names of directories whose members are not listed
+
+    Returns: generator of ArchiveMember
+    """
+
+    # the archive is opened once and shared by all its members
+    shared = SharedArchive(archive)
+    for info in shared.zip.infolist():
+        if info.is_dir():
+            continue
+        if any(prune(part) for part in info.filename.split('/')[:-1]):
+            continue
+        member = ArchiveMember(archive, info.filename, shared, info)
+        if not matches or matches(member):
+            yield member
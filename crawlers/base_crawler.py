@@ -1,8 +1,36 @@
+import crawlers.manifest as manifest
+import crawlers.metrics as metrics
+import crawlers.sharding as sharding
+import crawlers.store as store
+
 import os
 import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def strtobool(value):
+    """Converts a string representation of truth (as in configuration files) to True or False.
+
+    True values are y, yes, t, true, on and 1; false values are n, no, f, false, off and 0 (case insensitive).
+
+    Parameters:
+    - value: the string to convert
+
+    Returns: the boolean value of the string
+    """
+
+    value = value.strip().lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError('invalid truth value ' + repr(value))
 
 class Crawler:
-    def __init__(self, limit, workdir, needs_config, skip_existing):
+    def __init__(self, limit, workdir, needs_config, skip_existing, jobs = 1, prefetch = 2, http_timeout = 60, http_retries = 3, http_pool = None, file_filters = None, store_root = None, 
+                 shard = None, seed = None):
         """Creates the crawler.
         
         Parameters:
@@ -12,13 +40,56 @@ class Crawler:
                          to run
         - skip_existing: whether the crawler should avoid retrieving items that are 
                          already in the file system
+        - jobs:          the maximum number of items to retrieve concurrently
+        - prefetch:      the maximum number of retrieved items waiting to be consumed, when
+                         results are streamed through iter_crawl
+        - http_timeout:  seconds after which an HTTP connection that is not sending data is dropped
+        - http_retries:  the maximum number of times a failed HTTP request is retried (with
+                         exponential backoff)
+        - http_pool:     the maximum number of connections kept open to the same host, defaults 
+                         to the number of jobs (at least 10)
+        - file_filters:  globs (fnmatch style) of the files that will be processed inside the crawled
+                         items, if only some of them are interesting
+        - store_root:    directory of the content-addressed store where the files of the crawled
+                         items are deduplicated, if any
+        - shard:         pair of the index of the shard crawled by this crawler and of the number of
+                         shards, if the crawl is split among multiple nodes
+        - seed:          the seed of random choices, to make them reproducible
         """
         
         self.limit = limit
         self.workdir = workdir
         self.needs_config = needs_config
         self.skip_existing = skip_existing
+        self.jobs = max(1, jobs)
+        self.prefetch = max(0, prefetch)
+        # whether retrievals can print live progress: this is only readable if a single item
+        # is retrieved at a time, and nothing else is printing in the meantime
+        self.live_progress = self.jobs == 1
         self.conf_template_filename = 'crawler.conf.template'
+        self.shard = shard if shard and shard[1] > 1 else None
+        self.seed = seed
+        # each shard has its own manifest, so that the manifests of all shards can be collected in the same workdir
+        self.manifest_filename = 'crawl_manifest.jsonl'
+        if self.shard:
+            self.manifest_filename = 'crawl_manifest.shard-' + str(self.shard[0]) + '-of-' + str(self.shard[1]) + '.jsonl'
+        self.manifest = None
+        self.manifest_lock = threading.Lock()
+        self.http_timeout = http_timeout
+        self.http_retries = http_retries
+        self.http_pool = http_pool or max(10, self.jobs)
+        self.session = None
+        self.session_lock = threading.Lock()
+        self.file_filters = file_filters or []
+        self.store_root = store_root
+        self.store = None
+        self.store_lock = threading.Lock()
+        # (item description, error) pairs for all items that could not be retrieved
+        self.failures = []
+        # serializes interactive prompts coming from concurrent retrievals
+        self.prompt_lock = threading.Lock()
+        # durations, requests, bytes, cache hits and retries of this run
+        self.metrics = metrics.Metrics()
         
     def get_path(self, path):
         """Gets the full path (not absolute) of the the file or directory at the given path, relative to the workdir. 
@@ -42,6 +113,208 @@ class Crawler:
         
         return os.path.exists(self.get_path(path))
         
+    def get_session(self):
+        """Gets the HTTP session shared by all the requests of this crawler, creating it the first time.
+        
+        The session keeps connections alive and pooled across requests to the same host, and retries
+        requests failing because of connection errors or server errors.
+        
+        Returns: the requests.Session of this crawler
+        """
+        
+        # requests is imported only by the crawlers that issue HTTP requests, when they issue the first one
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        with self.session_lock:
+            if not self.session:
+                retry = Retry(total = self.http_retries, 
+                              backoff_factor = 0.5, 
+                              status_forcelist = [500, 502, 503, 504], 
+                              allowed_methods = ['HEAD', 'GET'], 
+                              raise_on_status = False)
+                adapter = HTTPAdapter(pool_connections = self.http_pool, pool_maxsize = self.http_pool, max_retries = retry)
+                self.session = requests.Session()
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+            return self.session
+            
+    def get(self, url, **kwargs):
+        """Issues a GET request through the session of this crawler, with the configured timeout if none is given.
+        
+        Parameters:
+        - url:    the url to request
+        - kwargs: additional parameters, as for requests.get
+        
+        Returns: the response
+        """
+        
+        kwargs.setdefault('timeout', self.http_timeout)
+        response = self.get_session().get(url, **kwargs)
+        
+        self.metrics.increment('http_requests', status = response.status_code)
+        self.metrics.observe('http_request_seconds', response.elapsed.total_seconds())
+        # retries performed by the session are recorded in the history of the underlying response
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', None)
+        if retries:
+            self.metrics.increment('http_retries', len(retries))
+        # the content of streamed responses is not read yet: its length is taken from the headers
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            self.metrics.increment('http_bytes', int(length))
+        elif not kwargs.get('stream'):
+            self.metrics.increment('http_bytes', len(response.content))
+        return response
+        
+    def get_manifest(self):
+        """Gets the manifest recording the retrievals performed in the workdir, loading it the first time.
+        
+        Returns: the Manifest of the workdir
+        """
+        
+        with self.manifest_lock:
+            if not self.manifest:
+                if self.shard:
+                    self.manifest = manifest.Manifest(self.get_path(self.manifest_filename), shard = self.shard_name())
+                else:
+                    self.manifest = manifest.Manifest(self.get_path(self.manifest_filename))
+            return self.manifest
+            
+    def shard_name(self):
+        return str(self.shard[0]) + '/' + str(self.shard[1]) if self.shard else None
+        
+    def owns(self, key):
+        """Yields whether the item with the given key belongs to the shard crawled by this crawler.
+        
+        Parameters:
+        - key: the key of the item (e.g. the full name of a repository, or the path of a jar)
+        
+        Returns: True if the item belongs to the shard (or the crawl is not sharded), False otherwise
+        """
+        
+        return sharding.owns(self.shard, key)
+        
+    def merge_manifests(self):
+        """Merges the manifests of all the shards found in the workdir (e.g. after collecting there the crawled
+        items of all nodes) into the manifest of the whole crawl.
+        
+        Returns: pair of the number of merged manifests and of the number of items in the merged manifest
+        """
+        
+        paths = [self.get_path(name) for name in sorted(os.listdir(self.workdir)) 
+                 if name.startswith('crawl_manifest.shard-') and name.endswith('.jsonl')]
+        return len(paths), manifest.merge(paths, self.get_path('crawl_manifest.jsonl'))
+            
+    def get_store(self):
+        """Gets the content-addressed store where crawled files are deduplicated, opening it the first time.
+        
+        Returns: the BlobStore of this crawler, or None if crawled files are not deduplicated
+        """
+        
+        with self.store_lock:
+            if self.store_root and not self.store:
+                self.store = store.BlobStore(self.store_root)
+            return self.store
+            
+    def close(self):
+        """Closes the manifest and the content-addressed store, if they have been opened."""
+        
+        with self.manifest_lock:
+            if self.manifest:
+                self.manifest.close()
+        with self.store_lock:
+            if self.store:
+                self.store.close()
+                self.store = None
+            
+    def is_crawled(self, path):
+        """Checks if the file or directory at the given path, relative to the workdir, has been completely retrieved. 
+        
+        Items are checked against the manifest of the workdir: an item whose retrieval has been interrupted, 
+        or whose size changed after its retrieval (e.g. a truncated file), is not considered retrieved. Items 
+        that are not in the manifest (e.g. retrieved before the manifest was introduced) are considered retrieved
+        if they exist.
+        
+        Parameters:
+        - path: the path, relative to the workdir, of the file or directory to check
+        
+        Returns: True if the file or directory has been completely retrieved, False otherwise
+        """
+        
+        if not self.exists(path):
+            return False
+            
+        record = self.get_manifest().lookup(path)
+        if not record:
+            return True
+        if record['status'] != 'complete':
+            return False
+        return record.get('size') is None or os.path.getsize(self.get_path(path)) == record['size']
+        
+    def retrieve_item(self, path, source, fetch, kind = 'download', update = None):
+        """Retrieves a single item to the given path, relative to the workdir, recording the retrieval in the manifest.
+        
+        If the item has already been completely retrieved and can be updated in place, it is updated without 
+        prompting the user. Otherwise, if the crawler skips existing items and the item has already been completely 
+        retrieved, nothing is done. Leftovers of items that have not been completely retrieved according to the 
+        manifest (e.g. interrupted retrievals or truncated files) are deleted without prompting the user.
+        
+        Parameters:
+        - path:   the path, relative to the workdir, of the file or directory to retrieve
+        - source: the url the item is retrieved from
+        - fetch:  function that stores the item at the given full path and returns its checksum, if any
+        - kind:   the kind of retrieval (e.g. 'download' or 'clone'), labeling its metrics
+        - update: function that updates an item already retrieved at the given full path and returns its checksum, 
+                  if any, or None if items cannot be updated in place
+        
+        Returns: the full path (not absolute) of the file or directory
+        """
+        
+        crawled = self.is_crawled(path)
+        if self.skip_existing and crawled and not update:
+            self.metrics.increment('items', kind = kind, status = 'skipped')
+            return self.get_path(path)
+        
+        target = self.get_path(path)
+        if crawled and update:
+            fetch = update
+        else:
+            record = self.get_manifest().lookup(path)
+            if record and not crawled and os.path.lexists(target):
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target)
+                else:
+                    os.remove(target)
+            target = self.make_file(path)
+        
+        self.get_manifest().add(path, source, 'started')
+        start = time.time()
+        try:
+            checksum = fetch(target)
+        except BaseException as e:
+            self.get_manifest().add(path, source, 'failed', error = str(e) or type(e).__name__, duration = time.time() - start)
+            self.metrics.increment('items', kind = kind, status = 'failed')
+            self.metrics.observe('item_seconds', time.time() - start, kind = kind, status = 'failed')
+            raise
+        duration = time.time() - start
+        
+        blobs = self.get_store()
+        if blobs and os.path.isfile(target):
+            # the checksum of downloaded files is their SHA-256, computed while downloading them
+            if blobs.add(target, checksum):
+                self.metrics.increment('store_duplicates')
+        elif blobs and os.path.isdir(target):
+            self.metrics.increment('store_duplicates', blobs.add_tree(target))
+        
+        size = os.path.getsize(target) if os.path.isfile(target) else None
+        self.get_manifest().add(path, source, 'complete', size = size, checksum = checksum, duration = duration)
+        self.metrics.increment('items', kind = kind, status = 'complete')
+        self.metrics.observe('item_seconds', duration, kind = kind, status = 'complete')
+        if size is not None:
+            self.metrics.increment('item_bytes', size, kind = kind)
+        return target
+        
     def make_file(self, path):
         """Creates a file or directory at the given path, relative to the workdir. 
         
@@ -59,7 +332,8 @@ class Crawler:
             
         target = self.get_path(path)
         if self.exists(path):
-            ans = input('\'' + target + '\' already exists, delete it? [y/n] ')
+            with self.prompt_lock:
+                ans = input('\'' + target + '\' already exists, delete it? [y/n] ')
             if ans.lower() == 'y' or ans.lower() == 'yes':
                 if os.path.isdir(target) and not os.path.islink(target):
                     shutil.rmtree(target)
@@ -73,6 +347,60 @@ class Crawler:
            
         return target
         
+    def iter_retrieve_all(self, retrieve, items, describe = str):
+        """Retrieves all the given items, using up to self.jobs concurrent workers, yielding 
+        their paths as soon as they are available.
+        
+        Retrievals proceed in background while the consumer processes the yielded paths, but 
+        never more than self.jobs + self.prefetch items are retrieved ahead of the consumer: a 
+        slow consumer thus bounds the space taken by retrieved items waiting to be processed.
+        
+        A failure while retrieving an item does not abort the retrieval of the other ones: 
+        the item is recorded in self.failures and left out of the result.
+        
+        Parameters:
+        - retrieve: function that retrieves a single item and returns the list of paths
+                    that have been stored on the file system for it
+        - items:    the items to retrieve
+        - describe: function yielding a human readable name for an item
+        
+        Returns: generator of paths, in the same order of the given items
+        """
+        
+        def safe_retrieve(item):
+            try:
+                return retrieve(item)
+            except Exception as e:
+                print('- ' + describe(item) + ': failed (' + str(e) + ')', flush = True)
+                self.failures.append((describe(item), e))
+                return []
+        
+        # the time spent by the consumer on the yielded paths is included, since retrievals proceed meanwhile
+        with self.metrics.stage('retrieve'):
+            yield from self.retrieve_items(safe_retrieve, items)
+            
+        if self.failures:
+            print('Failed retrievals: ' + str(len(self.failures)), flush = True)
+            
+    def retrieve_items(self, safe_retrieve, items):
+        if self.live_progress:
+            for item in items:
+                yield from safe_retrieve(item)
+        else:
+            executor = ThreadPoolExecutor(max_workers = self.jobs)
+            pending = deque()
+            try:
+                # futures are consumed in submission order to preserve the order of the items
+                for item in items:
+                    pending.append(executor.submit(safe_retrieve, item))
+                    if len(pending) >= self.jobs + self.prefetch:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                # if the user aborted (e.g. refusing to delete an existing item), do not start pending retrievals
+                executor.shutdown(cancel_futures = True)
+        
     def read_conf(self, config):
         """Reads the configuration for this crawler.
         
@@ -88,7 +416,15 @@ class Crawler:
         Returns: list of paths, containing only the crawled results that have been stored on the file system.
         """
         
-        raise Exception('No crawl implementation provided by ' + type(self).__name__)
+        return list(self.iter_crawl())
+        
+    def iter_crawl(self):
+        """Performs the crawling, yielding crawled results as soon as they are stored on the file system.
+
+        Returns: generator of paths, containing only the crawled results that have been stored on the file system.
+        """
+        
+        raise Exception('No iter_crawl implementation provided by ' + type(self).__name__)
         
     def requires_config(self):
         """Yields whether or not this crawler needs a configuration file.
@@ -98,6 +434,14 @@ class Crawler:
         
         return self.needs_config
         
+    def supports_config(self):
+        """Yields whether or not this crawler can be tuned through a configuration file, even if it does not need one.
+        
+        Returns: True if this crawler reads a configuration file when it is available, False otherwise
+        """
+        
+        return self.needs_config
+        
     def dump_conf_template(self):
         """Dumps the configuration template for this crawler, only if needed, in a file named crawler.conf.template.
         """
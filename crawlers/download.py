@@ -0,0 +1,133 @@
+import hashlib
+import os
+
+# bytes read from the network and written to disk at a time
+CHUNK_SIZE = 1024 * 1024
+
+def partial_path(target):
+    return target + '.part'
+
+def validator_path(target):
+    # the validator of the remote file a partial file has been downloaded from
+    return partial_path(target) + '.validator'
+
+def response_validator(response):
+    # If-Range requires a strong validator: weak ETags do not guarantee byte-identical contents
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+def read_validator(target):
+    try:
+        with open(validator_path(target)) as handle:
+            return handle.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def write_validator(target, validator):
+    if validator:
+        with open(validator_path(target), 'w') as handle:
+            handle.write(validator)
+    elif os.path.exists(validator_path(target)):
+        os.remove(validator_path(target))
+
+def fetch_checksum(get, url):
+    """Fetches a published checksum (e.g. the .sha1 files of Maven repositories).
+
+    Parameters:
+    - get: function issuing a GET request, with the same signature of requests.get
+    - url: the url of the checksum file
+
+    Returns: the checksum as a lowercase hex string, or None if it is not published
+    """
+
+    response = get(url)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    # some checksum files are in the form '<checksum>  <file name>'
+    content = response.content.decode('ascii', errors = 'replace').split()
+    return content[0].lower() if content else None
+
+def download(get, url, target, progress = False, sha1_url = None):
+    """Downloads the file at the given url.
+
+    The file is streamed in large chunks to a temporary file next to the target, that is renamed to the target
+    only when the download is complete (and verified): the target is thus either missing or complete. If the
+    temporary file of a previous, interrupted download exists, the download is resumed through an HTTP Range request,
+    conditional (If-Range) on the ETag or Last-Modified date of the remote file the temporary file has been downloaded
+    from: if the remote file changed, or if the server does not support ranges, the download starts over. Without such
+    a validator, the download is resumed only if the result can be verified against a published checksum.
+
+    Parameters:
+    - get:      function issuing a GET request, with the same signature of requests.get
+    - url:      the url of the file
+    - target:   the path where the file is stored
+    - progress: whether or not a progress bar should be printed
+    - sha1_url: the url of the published SHA-1 checksum of the file, if any: the download fails if the
+                downloaded file does not match it
+
+    Returns: the SHA-256 checksum of the file, as a lowercase hex string
+    """
+
+    from tqdm import tqdm
+    
+    partial = partial_path(target)
+    sha256 = hashlib.sha256()
+    sha1 = hashlib.sha1()
+
+    offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+    validator = read_validator(target) if offset else None
+    expected = None
+    if offset and not validator:
+        # a remote file that changed since the interrupted download would be silently corrupted
+        expected = fetch_checksum(get, sha1_url) if sha1_url else None
+        if not expected:
+            offset = 0
+    headers = None
+    if offset:
+        headers = { 'Range' : 'bytes=' + str(offset) + '-' }
+        if validator:
+            headers['If-Range'] = validator
+    response = get(url, headers = headers, stream = True)
+    if offset and response.status_code == 206:
+        # resuming: the checksums must also cover the bytes downloaded so far
+        with open(partial, 'rb') as handle:
+            for data in iter(lambda : handle.read(CHUNK_SIZE), b''):
+                sha256.update(data)
+                sha1.update(data)
+        mode = 'ab'
+    elif offset and response.status_code == 416:
+        # the partial file does not match the remote one anymore: start over
+        response.close()
+        offset = 0
+        response = get(url, stream = True)
+        mode = 'wb'
+    else:
+        # a full response, e.g. because the remote file changed
+        offset = 0
+        mode = 'wb'
+    response.raise_for_status()
+    if mode == 'wb':
+        write_validator(target, response_validator(response))
+
+    length = response.headers.get('Content-Length')
+    total = offset + int(length) if length else None
+    with open(partial, mode) as handle, tqdm(total = total, initial = offset, unit = 'B', unit_scale = True, ascii = True, desc = '  downloading', disable = not progress) as bar:
+        for data in response.iter_content(CHUNK_SIZE):
+            handle.write(data)
+            sha256.update(data)
+            sha1.update(data)
+            bar.update(len(data))
+
+    if sha1_url:
+        expected = expected or fetch_checksum(get, sha1_url)
+        if expected and expected != sha1.hexdigest():
+            os.remove(partial)
+            write_validator(target, None)
+            raise Exception('Checksum mismatch for ' + url + ' (expected SHA-1: ' + expected + ', actual: ' + sha1.hexdigest() + ')')
+
+    os.replace(partial, target)
+    write_validator(target, None)
+    return sha256.hexdigest()
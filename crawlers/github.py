@@ -1,15 +1,42 @@
 import crawlers.base_crawler as base
+from crawlers.download import download as download_file
+from crawlers.github_search import GitHubSearch, QueryPartitioner, MAX_SEARCH_RESULTS
 
-import requests
-import json
 import os
-from distutils.util import strtobool
-import git
-from tqdm import tqdm
+import shutil
+
+def make_progress():
+    # git is imported only when repositories are cloned
+    import git
+    
+    class Progress(git.remote.RemoteProgress):
+        def update(self, op_code, cur_count, max_count=None, message=''):
+            msg = '  cloning: ' + self._cur_line
+            last_msg_len = 0
+            if hasattr(self, 'last_msg_len'):
+                last_msg_len = self.last_msg_len
+            
+            self.last_msg_len = len(msg)
+            if len(msg) < last_msg_len:
+                msg += ' ' * (last_msg_len - len(msg) + 2)
+            print(msg + '\r', end = '', flush = True)
+            
+    return Progress()
+
+def sparse_variants(glob):
+    # leading wildcards match the path of the clone (and any directories inside it), while the other ones 
+    # match either inside a single directory level or across any number of directories
+    rest = glob.lstrip('*')
+    prefix = '**/*' if rest != glob and not rest.startswith('/') else '**/'
+    parts = rest.lstrip('/').split('*')
+    variants = [prefix + parts[0]]
+    for part in parts[1:]:
+        variants = [variant + wildcard + part for variant in variants for wildcard in ('*', '*/**/*')]
+    return variants
 
 class GitHubCrawler(base.Crawler):
-    def __init__(self, limit, workdir, skip_existing):
-        super().__init__(limit, workdir, True, skip_existing)
+    def __init__(self, limit, workdir, skip_existing, **options):
+        super().__init__(limit, workdir, True, skip_existing, **options)
         
     def dump_conf_template(self):
         template = '''[crawler]
@@ -21,6 +48,21 @@ token =
 clone = false
 # whether or not matching repositories should be downloaded as zip files inside the working directory
 zip = false
+# number of commits to clone (e.g. 1 for the last commit only), leave empty to clone the whole history
+depth = 
+# partial clone filter (e.g. blob:none to download file contents only when they are checked out),
+# leave empty to download all objects
+filter = 
+# whether or not only the files matching --filter-files should be checked out (sparse checkout)
+sparse = false
+# directory where bare mirrors of the crawled repositories are kept across executions: when provided,
+# repositories are fetched incrementally into their mirror and cloned locally from it (depth and filter
+# are ignored), leave empty to clone directly from github
+mirrors = 
+# base urls of the github APIs and of the github website (e.g. to target a github enterprise server,
+# or a local stand-in for benchmarking)
+api_url = https://api.github.com
+web_url = https://github.com
 
 [query]
 # main search query
@@ -59,8 +101,15 @@ pushed =
     def read_conf(self, config):
         self.crawler_user = config['crawler']['user']
         self.crawler_token = config['crawler']['token']
-        self.crawler_clone = bool(strtobool(config['crawler']['clone']))
-        self.crawler_zip = bool(strtobool(config['crawler']['zip']))
+        self.crawler_clone = base.strtobool(config['crawler']['clone'])
+        self.crawler_zip = base.strtobool(config['crawler']['zip'])
+        # options introduced later are optional, to keep older configurations valid
+        self.crawler_depth = config['crawler'].get('depth', '')
+        self.crawler_filter = config['crawler'].get('filter', '')
+        self.crawler_sparse = base.strtobool(config['crawler'].get('sparse', 'false') or 'false')
+        self.crawler_mirrors = config['crawler'].get('mirrors', '')
+        self.crawler_api_url = (config['crawler'].get('api_url', '') or 'https://api.github.com').rstrip('/')
+        self.crawler_web_url = (config['crawler'].get('web_url', '') or 'https://github.com').rstrip('/')
 
         
         self.query_query = config['query']['query']
@@ -81,15 +130,16 @@ pushed =
         self.query_pushed = config['query']['pushed']
         
     def query(self, url):
-        response = requests.get(url, auth=(self.crawler_user, self.crawler_token))
+        # errors (including rate limits) are handled by the search client
+        return self.get(url, auth=(self.crawler_user, self.crawler_token))
 
-        if response.ok:
-            return response
-        else:
-            response.raise_for_status()
-
-    def build_query(self):
-        query = 'https://api.github.com/search/repositories?q='
+    def build_query(self, page = 1, per_page = 100, qualifiers = None):
+        # qualifiers of a partition of the query override the configured ones
+        qualifiers = qualifiers or dict()
+        query_stars = qualifiers.get('stars', self.query_stars)
+        query_created = qualifiers.get('created', self.query_created)
+        
+        query = self.crawler_api_url + '/search/repositories?q='
 
         if self.query_query:
             query += self.query_query + '+'
@@ -115,93 +165,169 @@ pushed =
             query += 'followers:' + self.query_followers + '+'
         if self.query_forks:
             query += 'forks:' + self.query_forks + '+'
-        if self.query_stars:
-            query += 'stars:' + self.query_stars + '+'
+        if query_stars:
+            query += 'stars:' + query_stars + '+'
         if self.query_topics:
             query += 'topics:' + self.query_topics + '+'
-        if self.query_created:
-            query += 'created:' + self.query_created + '+'
+        if query_created:
+            query += 'created:' + query_created + '+'
         if self.query_pushed:
             query += 'pushed:' + self.query_pushed + '+'
 
         if query.endswith('+'):
             query = query[:-1]
-        query += '&sort=stars&order=desc&per_page=100&page=1'
+        query += '&sort=stars&order=desc&per_page=' + str(per_page) + '&page=' + str(page)
 
         return query
 
-    def crawl(self):
+    def update_mirror(self, repo, progress):
+        import git
+        
+        mirror = os.path.join(self.crawler_mirrors, repo['full_name'] + '.git')
+        if os.path.isdir(mirror):
+            # only new objects are fetched
+            git.Repo(mirror).remote('origin').fetch(prune = True, progress = progress)
+        else:
+            # mirrors always have the full history and all objects, so that they can serve any checkout
+            os.makedirs(os.path.dirname(mirror), exist_ok = True)
+            # leftovers of an interrupted mirroring
+            shutil.rmtree(mirror + '.tmp', ignore_errors = True)
+            git.Repo.clone_from(repo['clone_url'], mirror + '.tmp', progress = progress, mirror = True)
+            os.replace(mirror + '.tmp', mirror)
+        return mirror
+        
+    def clone_options(self, local = False):
+        options = []
+        # shallow and partial clones do not apply to local clones from mirrors, that already own all objects
+        if self.crawler_depth and not local:
+            options.append('--depth=' + self.crawler_depth)
+        if self.crawler_filter and not local:
+            options.append('--filter=' + self.crawler_filter)
+        if self.sparse_patterns():
+            # files are checked out after configuring the sparse checkout
+            options.append('--no-checkout')
+        return options
+        
+    def sparse_patterns(self):
+        if not self.crawler_sparse or not self.file_filters:
+            return []
+        
+        # globs are matched by fnmatch against full paths, while sparse checkout patterns follow the gitignore
+        # syntax: globs without slashes match file names at any depth in both, while in the other ones the
+        # wildcards of fnmatch also match slashes, unlike the ones of gitignore
+        patterns = []
+        for glob in self.file_filters:
+            if '/' in glob:
+                patterns.extend(sparse_variants(glob))
+            else:
+                patterns.append(glob)
+        return patterns
+        
+    def search(self):
+        search = GitHubSearch(self.query, self.jobs)
+        try:
+            return self.partitioned_search(search)
+        finally:
+            self.metrics.increment('github_rate_limited', search.limiter.backoffs)
+        
+    def partitioned_search(self, search):
+        if self.limit <= MAX_SEARCH_RESULTS:
+            return search.search(self.build_query, self.limit)
+        
+        matching, _ = search.count(self.build_query)
+        if matching <= MAX_SEARCH_RESULTS:
+            return search.search(self.build_query, self.limit)
+        
+        # a single search never yields more than MAX_SEARCH_RESULTS results
+        print('Partitioning the query...', flush = True)
+        count = lambda qualifiers : search.count(lambda page, per_page : self.build_query(page, per_page, qualifiers))
+        partitioner = QueryPartitioner(count, self.query_stars, self.query_created)
+        return matching, search.search_partitions(self.build_query, partitioner.partitions(matching), self.limit)
+
+    def iter_crawl(self):
         print('Preparing query...', flush = True)
-        url = self.build_query()
         print('Invoking GitHub APIs...', flush = True)
-        response = self.query(url)
-        result = json.loads(response.content.decode('utf-8'))
+        with self.metrics.stage('search'):
+            matching, repos = self.search()
 
-        matching = int(result['total_count'])
-        to_crawl = min(self.limit, matching)
         print('Matching projects: ' + str(matching))
-        print('Crawling up to: ' + str(to_crawl), flush = True)
+        if self.shard:
+            # all nodes get the same results: each one crawls its own share
+            repos = [repo for repo in repos if self.owns(repo['full_name'])]
+            print('Shard: ' + self.shard_name(), flush = True)
+        print('Crawling up to: ' + str(len(repos)), flush = True)
         
-        if to_crawl == 0:
+        if len(repos) == 0:
             print('Nothing to crawl: exiting')
             exit()
 
-        repos = list()
-        next_page = True
-        while next_page and len(repos) < to_crawl:
-            for repo in result['items']:
-                if len(repos) < to_crawl:
-                    repos.append(repo)
-                else: 
-                    break
-                    
-            if 'next' in response.links and len(repos) < to_crawl:
-                url = response.links['next']['url']
-                response = query(url)
-                result = json.loads(response.content.decode('utf-8'))
-            else:
-                next_page = False
-                
-        class Progress(git.remote.RemoteProgress):
-            def update(self, op_code, cur_count, max_count=None, message=''):
-                msg = '  cloning: ' + self._cur_line
-                last_msg_len = 0
-                if hasattr(self, 'last_msg_len'):
-                    last_msg_len = self.last_msg_len
-                
-                self.last_msg_len = len(msg)
-                if len(msg) < last_msg_len:
-                    msg += ' ' * (last_msg_len - len(msg) + 2)
-                print(msg + '\r', end = '', flush = True)
+        yield from self.iter_retrieve_all(self.retrieve, repos, lambda repo : repo['full_name'])
         
-        result = []
-        for repo in repos:
+    def retrieve(self, repo):
+        # without live progress, a single line is printed for each completed repository
+        sequential = self.live_progress
+        if sequential:
             print('- ' + repo['full_name'], flush = True)
 
-            if self.crawler_clone:
-                crawl_target = repo['full_name']
-                if self.exists(crawl_target) and self.skip_existing:
-                    target = self.get_path(crawl_target)
-                else:
+        result = []
+        if self.crawler_clone:
+            def clone(target):
+                import git
+                
+                if sequential:
                     print('  cloning...', end = '', flush = True)
-                    target = self.make_file(crawl_target)
-                    git.Repo.clone_from(repo['clone_url'], target, progress=Progress())
+                progress = make_progress() if sequential else None
+                if self.crawler_mirrors:
+                    # objects are taken from the (updated) local mirror, hardlinking them when possible
+                    with self.metrics.timed('mirror_update_seconds'):
+                        mirror = self.update_mirror(repo, progress)
+                    cloned = git.Repo.clone_from(mirror, target, progress = progress, multi_options = self.clone_options(local = True))
+                    cloned.remote('origin').set_url(repo['clone_url'])
+                else:
+                    cloned = git.Repo.clone_from(repo['clone_url'], target, progress = progress, multi_options = self.clone_options())
+                if self.sparse_patterns():
+                    cloned.git.sparse_checkout('set', '--no-cone', *self.sparse_patterns())
+                    # populates the working tree (fetching the needed blobs, with a partial clone)
+                    cloned.git.read_tree('-mu', 'HEAD')
+                if sequential:
                     print('', flush = True)
-                result.append(target)
-
-            if self.crawler_zip:
-                crawl_target = repo['full_name'] + '.zip'
-                if self.exists(crawl_target) and self.skip_existing:
-                    target = self.get_path(crawl_target)
                 else:
+                    print('- ' + repo['full_name'] + ': cloned', flush = True)
+                # the cloned commit identifies the content of the clone
+                return cloned.head.commit.hexsha
+                
+            def update(target):
+                import git
+                
+                if sequential:
+                    print('  updating...', end = '', flush = True)
+                progress = make_progress() if sequential else None
+                with self.metrics.timed('mirror_update_seconds'):
+                    mirror = self.update_mirror(repo, progress)
+                # the checkout is moved to the current head of the mirror, keeping its sparse checkout (if any)
+                updated = git.Repo(target)
+                updated.git.fetch(mirror, 'HEAD')
+                updated.git.reset('--hard', 'FETCH_HEAD')
+                if sequential:
+                    print('', flush = True)
+                else:
+                    print('- ' + repo['full_name'] + ': updated', flush = True)
+                return updated.head.commit.hexsha
+                
+            # with mirrors, existing checkouts are updated from them instead of being cloned again
+            result.append(self.retrieve_item(repo['full_name'], repo['clone_url'], clone, kind = 'clone', 
+                                             update = update if self.crawler_mirrors else None))
+
+        if self.crawler_zip:
+            zip_url = self.crawler_web_url + '/' + repo['full_name'] + '/archive/master.zip'
+            def download(target):
+                if sequential:
                     print('  downloading...', end = '', flush = True)
-                    zip_url = 'https://github.com/' + repo['full_name'] + '/archive/master.zip'
-                    zip_response = requests.get(zip_url, stream = True)
-                    target = self.make_file(crawl_target)
-                    with open(target, 'wb') as handle:
-                        for data in tqdm(zip_response.iter_content(), ascii = True, desc='  downloading'):
-                            handle.write(data)
-                result.append(target)
+                checksum = download_file(self.get, zip_url, target, progress = sequential)
+                if not sequential:
+                    print('- ' + repo['full_name'] + ': downloaded', flush = True)
+                return checksum
+                
+            result.append(self.retrieve_item(repo['full_name'] + '.zip', zip_url, download))
         
         return result
-
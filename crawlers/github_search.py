@@ -0,0 +1,356 @@
+import datetime
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# GitHub never returns more than this number of results for a single search
+MAX_SEARCH_RESULTS = 1000
+
+class RateLimiter:
+    def __init__(self):
+        """Creates a token bucket driven by the rate limit headers returned by the GitHub APIs.
+
+        The bucket holds as many tokens as the requests still available in the current rate limit
+        window (X-RateLimit-Remaining), and it is refilled when the window resets (X-RateLimit-Reset).
+        Before the first response, the number of available requests is unknown and requests are not delayed.
+        """
+
+        self.remaining = None
+        self.reset = 0
+        # requests are not issued before this time, after an explicit backoff
+        self.blocked_until = 0
+        # number of rate limited responses
+        self.backoffs = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until a request can be issued, and consumes a token for it."""
+
+        while True:
+            with self.lock:
+                now = time.time()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.remaining is not None and self.remaining <= 0 and now < self.reset:
+                    wait = self.reset - now
+                else:
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+            time.sleep(wait)
+
+    def update(self, response):
+        """Refreshes the bucket with the rate limit headers of a response.
+
+        Parameters:
+        - response: the response of a request
+        """
+
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        remaining = int(remaining)
+        reset = int(reset)
+        with self.lock:
+            if reset > self.reset:
+                # a new window started
+                self.reset = reset
+                self.remaining = remaining
+            elif reset == self.reset:
+                # responses of concurrent requests can arrive out of order: keep the lowest count
+                self.remaining = min(self.remaining, remaining) if self.remaining is not None else remaining
+
+    def backoff(self, response, attempt):
+        """Delays all subsequent requests after a response that hit a rate limit.
+
+        The delay is taken from the Retry-After header, or from the reset of the current window
+        if no requests are left in it; otherwise, an exponential backoff is applied.
+
+        Parameters:
+        - response: the response of the rate limited request
+        - attempt:  how many times the request has been attempted already
+
+        Returns: the number of seconds requests will be delayed
+        """
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            until = time.time() + int(retry_after)
+        elif response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+            # one more second to avoid racing with the reset
+            until = int(response.headers.get('X-RateLimit-Reset')) + 1
+        else:
+            until = time.time() + min(60 * 2 ** attempt, 900)
+
+        with self.lock:
+            self.backoffs += 1
+            self.blocked_until = max(self.blocked_until, until)
+            return max(0, self.blocked_until - time.time())
+
+def is_rate_limited(response):
+    """Yields whether the given response has been rejected because of a (primary or secondary) rate limit.
+
+    Parameters:
+    - response: the response of a request
+
+    Returns: True if the request should be retried later, False otherwise
+    """
+
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    return response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers or b'rate limit' in response.content
+
+class GitHubSearch:
+    def __init__(self, get, jobs, max_attempts = 10):
+        """Creates a client for the GitHub search APIs.
+
+        Parameters:
+        - get:          function issuing an (authenticated) GET request on an url and returning its response
+        - jobs:         the maximum number of concurrent requests
+        - max_attempts: the maximum number of times a rate limited request is attempted
+        """
+
+        self.get = get
+        self.jobs = max(1, jobs)
+        self.max_attempts = max_attempts
+        self.limiter = RateLimiter()
+
+    def request(self, url):
+        """Issues a request, waiting for the rate limit if needed and retrying it if it gets rate limited.
+
+        Parameters:
+        - url: the url to request
+
+        Returns: the decoded json content of the response
+        """
+
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire()
+            response = self.get(url)
+            self.limiter.update(response)
+            if not is_rate_limited(response):
+                response.raise_for_status()
+                return json.loads(response.content.decode('utf-8'))
+
+            wait = self.limiter.backoff(response, attempt)
+            print('  rate limited: retrying in ' + str(math.ceil(wait)) + ' seconds', flush = True)
+
+        raise Exception('Giving up on ' + url + ' after ' + str(self.max_attempts) + ' rate limited attempts')
+
+    def count(self, page_url):
+        """Yields the total number of results of a search, retrieving a single result.
+
+        Parameters:
+        - page_url: function yielding the url of a page of the search, given the page number (starting from 1)
+                    and the number of results per page
+
+        Returns: pair of the total number of results and the list of the (possibly empty) first result
+        """
+
+        first = self.request(page_url(1, 1))
+        return int(first['total_count']), first['items']
+
+    def fetch(self, urls):
+        """Fetches the given pages concurrently.
+
+        Parameters:
+        - urls: the urls of the pages
+
+        Returns: the list of the results of all pages, following the order of the urls
+        """
+
+        items = []
+        with ThreadPoolExecutor(max_workers = self.jobs) as executor:
+            for result in executor.map(self.request, urls):
+                items += result['items']
+        return items
+
+    def search(self, page_url, limit, per_page = 100):
+        """Retrieves the results of a search.
+
+        The first page yields the total number of results: all the other needed pages are then
+        computed up front and fetched concurrently.
+
+        Parameters:
+        - page_url: function yielding the url of a page of the search, given the page number (starting from 1)
+                    and the number of results per page
+        - limit:    the maximum number of results to retrieve
+        - per_page: the number of results per page
+
+        Returns: pair of the total number of results matching the search and the list of
+                 retrieved results, in the order returned by the search
+        """
+
+        first = self.request(page_url(1, per_page))
+        total = int(first['total_count'])
+        to_crawl = min(limit, total, MAX_SEARCH_RESULTS)
+
+        last_page = math.ceil(to_crawl / per_page)
+        items = first['items'] + self.fetch([page_url(page, per_page) for page in range(2, last_page + 1)])
+        return total, items[:to_crawl]
+
+    def search_partitions(self, page_url, partitions, limit, per_page = 100):
+        """Retrieves the results of a search split in disjoint partitions, each one yielding at most
+        MAX_SEARCH_RESULTS results.
+
+        The pages of all partitions are fetched concurrently. Results are merged following the order of the 
+        partitions, dropping the ones that have already been returned by a previous partition 
+        (e.g. a repository that gained stars while crawling).
+
+        Parameters:
+        - page_url:   function yielding the url of a page of the search, given the page number (starting from 1),
+                      the number of results per page and the qualifiers of the partition
+        - partitions: iterable of pairs of the qualifiers of a partition and its number of results, consumed
+                      only until limit results are covered
+        - limit:      the maximum number of results to retrieve
+        - per_page:   the number of results per page
+
+        Returns: the list of retrieved results
+        """
+
+        urls = []
+        covered = 0
+        for qualifiers, count in partitions:
+            needed = min(count, limit - covered, MAX_SEARCH_RESULTS)
+            urls += [page_url(page, per_page, qualifiers) for page in range(1, math.ceil(needed / per_page) + 1)]
+            covered += needed
+            if covered >= limit:
+                break
+
+        items = []
+        seen = set()
+        for item in self.fetch(urls):
+            if item['full_name'] not in seen:
+                seen.add(item['full_name'])
+                items.append(item)
+        return items[:limit]
+
+def parse_range(value, parse):
+    """Parses a range qualifier of the GitHub search syntax: 'a', 'a..b', 'a..*', '*..b', '>a', '>=a', '<b' or '<=b'.
+
+    Parameters:
+    - value: the value of the qualifier
+    - parse: function parsing a bound into an integer (raising ValueError for invalid bounds)
+
+    Returns: pair of the lowest and highest included values (None if unbounded), or None if the value cannot be parsed
+    """
+
+    value = value.strip()
+    try:
+        if not value:
+            return None, None
+        if '..' in value:
+            low, high = value.split('..', 1)
+            return (None if low == '*' else parse(low)), (None if high == '*' else parse(high))
+        if value.startswith('>='):
+            return parse(value[2:]), None
+        if value.startswith('>'):
+            return parse(value[1:]) + 1, None
+        if value.startswith('<='):
+            return None, parse(value[2:])
+        if value.startswith('<'):
+            return None, parse(value[1:]) - 1
+        return parse(value), parse(value)
+    except ValueError:
+        return None
+
+def date_ordinal(value):
+    return datetime.date.fromisoformat(value).toordinal()
+
+def ordinal_date(value):
+    return datetime.date.fromordinal(value).isoformat()
+
+class QueryPartitioner:
+    def __init__(self, count, stars, created):
+        """Creates a partitioner that splits a search in disjoint partitions, each one yielding at most 
+        MAX_SEARCH_RESULTS results.
+
+        The search is first split on the 'stars' qualifier, and a single number of stars yielding too many 
+        results is further split on the 'created' qualifier. Ranges are bisected adaptively, following the 
+        number of results of each range.
+
+        Parameters:
+        - count:   function yielding the total number of results and the first result of the search, 
+                   given the qualifiers (a dictionary) overriding the ones of the search
+        - stars:   the 'stars' qualifier of the search
+        - created: the 'created' qualifier of the search
+        """
+
+        self.count = count
+        self.stars = parse_range(stars, int)
+        self.created = parse_range(created, date_ordinal)
+
+    def partitions(self, total):
+        """Splits the search.
+
+        Partitions are generated lazily, in descending order of stars, so that consuming them in order 
+        preserves the order of a search sorted by stars.
+
+        Parameters:
+        - total: the total number of results of the search
+
+        Returns: generator of pairs of the qualifiers of a partition and its number of results
+        """
+
+        if self.stars:
+            low, high = self.stars
+            low = max(0, low or 0)
+            if high is None:
+                # the bound is given by the most starred repository
+                _, first = self.count({ 'stars': str(low) + '..*' })
+                high = first[0]['stargazers_count'] if first else low
+            yield from self.split_stars(low, high, total)
+        elif self.created:
+            yield from self.split_created(dict(), total)
+        else:
+            self.warn('cannot partition the query')
+            yield dict(), total
+
+    def split_stars(self, low, high, count):
+        if count <= MAX_SEARCH_RESULTS:
+            if count > 0:
+                yield { 'stars': str(low) + '..' + str(high) }, count
+            return
+        if low >= high:
+            yield from self.split_created({ 'stars': str(low) }, count)
+            return
+
+        # stars are heavily skewed towards low values: split on the geometric mean
+        mid = min(high - 1, max(low, int(math.sqrt((low + 1) * (high + 1))) - 1))
+        # the more starred half is crawled first
+        upper, _ = self.count({ 'stars': str(mid + 1) + '..' + str(high) })
+        yield from self.split_stars(mid + 1, high, upper)
+        yield from self.split_stars(low, mid, max(0, count - upper))
+
+    def split_created(self, qualifiers, count):
+        if self.created:
+            low, high = self.created
+        else:
+            low, high = None, None
+        # github was launched in 2008
+        low = low or date_ordinal('2007-10-01')
+        high = high or datetime.date.today().toordinal()
+        yield from self.split_dates(qualifiers, low, high, count)
+
+    def split_dates(self, qualifiers, low, high, count):
+        if count <= MAX_SEARCH_RESULTS or low >= high:
+            if count > MAX_SEARCH_RESULTS:
+                self.warn('more than ' + str(MAX_SEARCH_RESULTS) + ' repositories created on ' + ordinal_date(low))
+            if count > 0:
+                yield dict(qualifiers, created = ordinal_date(low) + '..' + ordinal_date(high)), count
+            return
+
+        mid = (low + high) // 2
+        # the most recent half is crawled first
+        upper, _ = self.count(dict(qualifiers, created = ordinal_date(mid + 1) + '..' + ordinal_date(high)))
+        yield from self.split_dates(qualifiers, mid + 1, high, upper)
+        yield from self.split_dates(qualifiers, low, mid, max(0, count - upper))
+
+    def warn(self, reason):
+        print('  warning: ' + reason + ', some results will not be crawled', flush = True)
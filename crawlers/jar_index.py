@@ -0,0 +1,156 @@
+import gzip
+import io
+import struct
+from array import array
+
+class JarIndex:
+    def __init__(self):
+        """Creates an empty, compact index of jar paths.
+
+        Paths are stored back to back in a single byte buffer, with their start offsets
+        kept in an array, to keep millions of entries affordable in memory.
+        """
+
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def add(self, path):
+        """Adds a jar path to the index.
+
+        Parameters:
+        - path: the path of the jar, relative to the root of the repository
+        """
+
+        self.data += path.encode('utf-8')
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def sample(self, k, rng):
+        """Draws jar paths uniformly at random, without replacement.
+
+        Parameters:
+        - k:   the number of paths to draw (all the paths are returned if the index is smaller)
+        - rng: the random.Random instance to draw with
+
+        Returns: list of paths
+        """
+
+        return [self[i] for i in rng.sample(range(len(self)), min(k, len(self)))]
+
+def is_wanted_jar(path):
+    """Yields whether the given path points to a jar that is worth crawling (javadoc and sources jars are not).
+
+    Parameters:
+    - path: the path of the file
+
+    Returns: True if the file is an interesting jar, False otherwise
+    """
+
+    return path.endswith('.jar') and not path.endswith('-javadoc.jar') and not path.endswith('-sources.jar')
+
+def read_jar_list(stream, base_url):
+    """Reads jar paths from a flat list, with one path (relative to the repository root) or url per line.
+
+    Parameters:
+    - stream:   binary stream with the contents of the list
+    - base_url: url of the repository root, stripped from lines that are full urls
+
+    Returns: generator of jar paths relative to the repository root
+    """
+
+    for line in io.TextIOWrapper(stream, encoding = 'utf-8', errors = 'replace'):
+        path = line.strip()
+        if path.startswith(base_url):
+            path = path[len(base_url):]
+        elif path.startswith('./'):
+            path = path[2:]
+        if is_wanted_jar(path):
+            yield path.lstrip('/')
+
+def read_nexus_index(stream):
+    """Reads jar paths from a Maven Indexer (nexus) index, as published in
+    .index/nexus-maven-repository-index.gz by Maven Central.
+
+    Each document of the index stores the coordinates of an artifact in its 'u' field, in the form
+    'groupId|artifactId|version|classifier|extension' ('NA' for no classifier): the extension is only
+    there for classified artifacts, while for main artifacts it is the 7th entry of the 'i' field
+    ('packaging|lastModified|size|sourcesExists|javadocExists|signatureExists|extension').
+
+    Parameters:
+    - stream: binary stream with the uncompressed contents of the index
+
+    Returns: generator of jar paths relative to the repository root
+    """
+
+    def read(n):
+        data = stream.read(n)
+        if len(data) < n:
+            raise EOFError()
+        return data
+
+    version = read(1)[0]
+    if version != 1:
+        raise Exception('Unsupported nexus index version: ' + str(version))
+    # timestamp of the index
+    read(8)
+
+    while True:
+        try:
+            fields = struct.unpack('>i', read(4))[0]
+        except EOFError:
+            return
+
+        uinfo = None
+        info = None
+        for _ in range(fields):
+            # field flags
+            read(1)
+            name = read(struct.unpack('>H', read(2))[0]).decode('utf-8', errors = 'replace')
+            value = read(struct.unpack('>i', read(4))[0])
+            if name == 'u':
+                uinfo = value.decode('utf-8', errors = 'replace')
+            elif name == 'i':
+                info = value.decode('utf-8', errors = 'replace')
+
+        if not uinfo:
+            # descriptor or deleted documents
+            continue
+        parts = uinfo.split('|')
+        if len(parts) < 4:
+            continue
+        if len(parts) >= 5:
+            extension = parts[4]
+        else:
+            info_parts = info.split('|') if info else []
+            extension = info_parts[6] if len(info_parts) >= 7 else None
+        if extension != 'jar':
+            continue
+        group, artifact, version, classifier = parts[:4]
+        name = artifact + '-' + version + ('' if classifier == 'NA' else '-' + classifier) + '.jar'
+        path = group.replace('.', '/') + '/' + artifact + '/' + version + '/' + name
+        if is_wanted_jar(path):
+            yield path
+
+def open_index(location, stream_url):
+    """Opens the given index, decompressing it on the fly if its name ends with '.gz'.
+
+    Parameters:
+    - location:   local path or url of the index
+    - stream_url: function that opens a binary stream on a url
+
+    Returns: binary stream with the contents of the index
+    """
+
+    if location.startswith('http://') or location.startswith('https://'):
+        stream = io.BufferedReader(stream_url(location), 1024 * 1024)
+    else:
+        stream = open(location, 'rb', buffering = 1024 * 1024)
+
+    if location.endswith('.gz'):
+        return gzip.GzipFile(fileobj = stream)
+    return stream
@@ -0,0 +1,32 @@
+import html
+import re
+
+# the href attribute of an anchor, either double quoted, single quoted or unquoted
+HREF = re.compile(rb'''<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+def iter_hrefs(chunks):
+    """Extracts the links of the anchors of an html page, while its content is still being received.
+
+    Only anchors are parsed, without building a document tree: this is enough for the simple listings
+    generated by web servers for their directories. Entities in links are decoded.
+
+    Parameters:
+    - chunks: iterable of the (binary) chunks of the content of the page, e.g. response.iter_content()
+
+    Returns: generator of the links, in the order they appear in the page
+    """
+
+    buffer = b''
+    for chunk in chunks:
+        buffer += chunk
+        # the last tag might be incomplete: it is parsed along with the next chunk
+        start = buffer.rfind(b'<')
+        cut = len(buffer) if start == -1 or buffer.find(b'>', start) != -1 else start
+        yield from hrefs(buffer[:cut])
+        buffer = buffer[cut:]
+    yield from hrefs(buffer)
+
+def hrefs(content):
+    for match in HREF.finditer(content):
+        link = match.group(1) if match.group(1) is not None else match.group(2) if match.group(2) is not None else match.group(3)
+        yield html.unescape(link.decode('utf-8', errors = 'replace'))
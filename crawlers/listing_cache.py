@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# a listing read from a DiskListingCache: fetched is the (epoch) time of its last retrieval or revalidation
+CachedListing = namedtuple('CachedListing', ['links', 'etag', 'last_modified', 'fetched'])
+
+class ListingCache:
+    def __init__(self, max_entries):
+        """Creates a bounded, thread-safe, least-recently-used cache of parsed directory listings.
+
+        Parameters:
+        - max_entries: the maximum number of listings kept in memory
+        """
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # url -> event set when the listing being loaded by another thread is available
+        self.loading = dict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url, load):
+        """Yields the listing of the given url, loading it only if it is not already cached.
+
+        Concurrent requests for the same url that is not cached yet are coalesced:
+        only one of them performs the load, while the others wait for its result.
+
+        Parameters:
+        - url:  the url of the listing
+        - load: function that loads the listing given its url
+
+        Returns: the listing, as a tuple of links
+        """
+
+        while True:
+            with self.lock:
+                if url in self.entries:
+                    self.entries.move_to_end(url)
+                    self.hits += 1
+                    return self.entries[url]
+
+                pending = self.loading.get(url)
+                if not pending:
+                    self.misses += 1
+                    pending = threading.Event()
+                    self.loading[url] = pending
+                    break
+
+            # another thread is loading this listing: wait for it and look it up again
+            # (if that load failed, this thread will attempt it again)
+            pending.wait()
+
+        try:
+            listing = tuple(load(url))
+            with self.lock:
+                self.entries[url] = listing
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last = False)
+            return listing
+        finally:
+            with self.lock:
+                del self.loading[url]
+            pending.set()
+
+class DiskListingCache:
+    def __init__(self, path):
+        """Creates (or opens) a persistent cache of parsed directory listings, backed by a SQLite database.
+
+        Along with the links, each listing stores the validators (ETag and Last-Modified headers)
+        of the response it has been parsed from, so that it can be revalidated with a conditional request.
+
+        Parameters:
+        - path: the path of the database file
+        """
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok = True)
+        # the connection is shared among the walking threads, with accesses serialized by the lock
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS listings (url TEXT PRIMARY KEY, links TEXT, etag TEXT, last_modified TEXT, fetched REAL)')
+        self.db.commit()
+        self.lock = threading.Lock()
+
+    def lookup(self, url):
+        """Yields the cached listing of the given url.
+
+        Parameters:
+        - url: the url of the listing
+
+        Returns: a CachedListing, or None if the listing is not cached
+        """
+
+        with self.lock:
+            row = self.db.execute('SELECT links, etag, last_modified, fetched FROM listings WHERE url = ?', (url,)).fetchone()
+        if not row:
+            return None
+        links = tuple(row[0].split('\n')) if row[0] else ()
+        return CachedListing(links, row[1], row[2], row[3])
+
+    def store(self, url, links, etag, last_modified):
+        """Stores the listing of the given url, marking it as fetched now.
+
+        Parameters:
+        - url:           the url of the listing
+        - links:         the links of the listing
+        - etag:          the ETag header of the response, if any
+        - last_modified: the Last-Modified header of the response, if any
+        """
+
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)', (url, '\n'.join(links), etag, last_modified, time.time()))
+            self.db.commit()
+
+    def touch(self, url):
+        """Marks the listing of the given url as fetched now, after a successful revalidation.
+
+        Parameters:
+        - url: the url of the listing
+        """
+
+        with self.lock:
+            self.db.execute('UPDATE listings SET fetched = ? WHERE url = ?', (time.time(), url))
+            self.db.commit()
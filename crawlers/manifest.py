@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+
+def read_records(path):
+    """Reads all the records of a manifest, in the order they have been added.
+
+    Parameters:
+    - path: the path of the manifest file
+
+    Returns: generator of records (nothing, if the file does not exist)
+    """
+
+    if not os.path.isfile(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # a record truncated by an interrupted execution
+                continue
+
+def merge(paths, target):
+    """Merges manifests (e.g. the ones written by the shards of a crawl) into a single one, keeping
+    only the latest record of each item.
+
+    Parameters:
+    - paths:  the paths of the manifests to merge
+    - target: the path of the merged manifest: if it exists, its records are merged as well, and 
+              it is replaced only when the merge is complete
+
+    Returns: the number of items in the merged manifest
+    """
+
+    records = dict()
+    for path in [target] + [path for path in paths if path != target]:
+        for record in read_records(path):
+            current = records.get(record['path'])
+            if not current or record.get('time', 0) >= current.get('time', 0):
+                records[record['path']] = record
+
+    temp = target + '.tmp'
+    with open(temp, 'w') as f:
+        for record in sorted(records.values(), key = lambda record : record.get('time', 0)):
+            f.write(json.dumps(record) + '\n')
+    os.replace(temp, target)
+    return len(records)
+
+class Manifest:
+    def __init__(self, path, **defaults):
+        """Opens the crawl manifest at the given path, an append-only log (in json lines format)
+        of the retrievals performed in a working directory.
+
+        Each line records the status of the retrieval of an item ('started', 'complete' or 'failed'),
+        along with its path (relative to the working directory), its source url, the time it was
+        recorded and, for completed items, their size, checksum and retrieval time. The last line
+        for a path describes its current status.
+
+        Parameters:
+        - path:     the path of the manifest file, created when the first record is added
+        - defaults: entries added to all the new records (e.g. the shard that retrieved them)
+        """
+
+        self.path = path
+        self.defaults = defaults
+        self.records = dict()
+        self.lock = threading.Lock()
+        self.file = None
+
+        for record in read_records(path):
+            self.records[record['path']] = record
+
+    def lookup(self, path):
+        """Yields the latest record of the item at the given path.
+
+        Parameters:
+        - path: the path of the item, relative to the working directory
+
+        Returns: the record (a dictionary), or None if the item has never been recorded
+        """
+
+        with self.lock:
+            return self.records.get(path)
+
+    def add(self, path, source, status, **details):
+        """Records the status of the item at the given path.
+
+        Parameters:
+        - path:    the path of the item, relative to the working directory
+        - source:  the url the item is retrieved from
+        - status:  the status of the retrieval
+        - details: additional entries of the record
+
+        Returns: the new record
+        """
+
+        record = dict(self.defaults, path = path, source = source, status = status, time = time.time(), **details)
+        with self.lock:
+            if not self.file:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+                self.file = open(self.path, 'a')
+            # records are flushed one by one, so that an interrupted execution loses at most the last one
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            self.records[path] = record
+        return record
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,146 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+class Metrics:
+    def __init__(self):
+        """Creates an empty collection of metrics of a crawl run.
+
+        Metrics are identified by a name and by a set of labels (e.g. the stage of a duration, or the status
+        of an HTTP response). Three kinds of metrics are recorded:
+        - counters, that are incremented (e.g. requests, bytes, cache hits)
+        - gauges, that are set to the latest value (e.g. the size of a cache at the end of the run)
+        - durations, of which the count, total, minimum and maximum are kept (e.g. per stage and per item)
+
+        All methods can be called concurrently.
+        """
+
+        self.counters = dict()
+        self.gauges = dict()
+        self.durations = dict()
+        self.start = time.time()
+        self.lock = threading.Lock()
+
+    def increment(self, name, amount = 1, **labels):
+        """Increments a counter.
+
+        Parameters:
+        - name:   the name of the counter
+        - amount: the amount added to the counter
+        - labels: the labels of the counter
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        """Records a duration.
+
+        Parameters:
+        - name:    the name of the duration
+        - seconds: the observed duration
+        - labels:  the labels of the duration
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            count, total, low, high = self.durations.get(key, (0, 0.0, seconds, seconds))
+            self.durations[key] = (count + 1, total + seconds, min(low, seconds), max(high, seconds))
+
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        """Records the duration of the enclosed block, even if it raises an exception.
+
+        Parameters:
+        - name:   the name of the duration
+        - labels: the labels of the duration
+        """
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def stage(self, stage):
+        return self.timed('stage_seconds', stage = stage)
+
+    def summary(self):
+        """Yields all the recorded metrics.
+
+        Returns: a dictionary, that can be serialized in json format, with the duration of the run and
+                 the lists of counters, gauges and durations (each one with its name, labels and values)
+        """
+
+        with self.lock:
+            return {
+                'duration' : time.time() - self.start,
+                'counters' : [{ 'name' : name, 'labels' : dict(labels), 'value' : value } for (name, labels), value in sorted(self.counters.items())],
+                'gauges' : [{ 'name' : name, 'labels' : dict(labels), 'value' : value } for (name, labels), value in sorted(self.gauges.items())],
+                'durations' : [{ 'name' : name, 'labels' : dict(labels), 'count' : count, 'sum' : total, 'min' : low, 'max' : high }
+                               for (name, labels), (count, total, low, high) in sorted(self.durations.items())],
+            }
+
+    def write_json(self, path):
+        write_atomically(path, json.dumps(self.summary(), indent = 2) + '\n')
+
+    def write_prometheus(self, path, prefix = 'crawler_', **labels):
+        """Writes the metrics in the Prometheus text format, e.g. for the textfile collector of the node exporter.
+
+        Counters get the '_total' suffix, durations are exported as summaries (with '_sum' and '_count' series)
+        along with '_min' and '_max' gauges.
+
+        Parameters:
+        - path:   the path of the file, that is replaced atomically
+        - prefix: the prefix of the names of all metrics
+        - labels: labels added to all metrics (e.g. the name of the crawler)
+        """
+
+        summary = self.summary()
+        lines = []
+        declared = set()
+        def series(name, kind, metric_labels, value):
+            if name not in declared:
+                declared.add(name)
+                lines.append('# TYPE ' + name + ' ' + kind)
+            lines.append(name + format_labels(dict(labels, **metric_labels)) + ' ' + repr(float(value)))
+
+        series(prefix + 'run_duration_seconds', 'gauge', dict(), summary['duration'])
+        for counter in summary['counters']:
+            series(prefix + counter['name'] + '_total', 'counter', counter['labels'], counter['value'])
+        for gauge in summary['gauges']:
+            series(prefix + gauge['name'], 'gauge', gauge['labels'], gauge['value'])
+        for duration in summary['durations']:
+            name = prefix + duration['name']
+            if name not in declared:
+                declared.add(name)
+                lines.append('# TYPE ' + name + ' summary')
+            lines.append(name + '_sum' + format_labels(dict(labels, **duration['labels'])) + ' ' + repr(float(duration['sum'])))
+            lines.append(name + '_count' + format_labels(dict(labels, **duration['labels'])) + ' ' + repr(float(duration['count'])))
+        for duration in summary['durations']:
+            series(prefix + duration['name'] + '_min', 'gauge', duration['labels'], duration['min'])
+        for duration in summary['durations']:
+            series(prefix + duration['name'] + '_max', 'gauge', duration['labels'], duration['max'])
+        write_atomically(path, '\n'.join(lines) + '\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value : str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(name + '="' + escape(value) + '"' for name, value in sorted(labels.items())) + '}'
+
+def write_atomically(path, content):
+    # collectors (and other readers) never see a partially written file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        f.write(content)
+    os.replace(temp, path)
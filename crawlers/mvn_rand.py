@@ -1,16 +1,35 @@
 import crawlers.base_crawler as base
+from crawlers.listing_cache import ListingCache, DiskListingCache
+from crawlers.download import download as download_file
+from crawlers.jar_index import JarIndex, open_index, read_jar_list, read_nexus_index
+from crawlers.listing import iter_hrefs
+from crawlers.sharding import make_rng, share
 
-import requests
-from bs4 import BeautifulSoup
-import random
-from tqdm import tqdm
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 class MvnRandom(base.Crawler):
-    def __init__(self, limit, workdir, skip_existing):
-        super().__init__(limit, workdir, False, skip_existing)
+    def __init__(self, limit, workdir, skip_existing, **options):
+        super().__init__(limit, workdir, False, skip_existing, **options)
 
         # this the full maven repository
-        self.mvn_base = 'https://repo1.maven.org/maven2/'
+        self.set_repository('https://repo1.maven.org/maven2/')
+        
+        # listings are shared among all random walks, so that directories visited by
+        # more walks (e.g. the upper levels) are fetched only once per run
+        self.listings = ListingCache(10000)
+        
+        # defaults for the optional configuration
+        self.listing_cache = True
+        self.listing_ttl = 24
+        self.offline = False
+        self.index = ''
+        self.index_format = 'list'
+        self.disk_listings = None
+        self.listing_cache_filename = '.mvn_listings.sqlite'
+        
+    def set_repository(self, mvn_base):
+        self.mvn_base = mvn_base.rstrip('/') + '/'
 
         # 'org' has the most jars
         mvn_org = self.mvn_base + 'org/'
@@ -23,16 +42,99 @@ class MvnRandom(base.Crawler):
         # of immediately descend in those ones
         # 'org' is listed more times to increase the chance of hitting
         self.sources = [mvn_org, mvn_org, mvn_org, mvn_com, mvn_net, mvn_io, self.mvn_base]
+        
+    def supports_config(self):
+        return True
+        
+    def dump_conf_template(self):
+        template = '''[crawler]
+# base url of the maven repository (e.g. a mirror, or a local stand-in for benchmarking)
+repository = https://repo1.maven.org/maven2/
+# whether or not directory listings should be cached inside the working directory, across executions
+listing_cache = true
+# hours after which a cached listing is revalidated against the repository
+listing_ttl = 24
+# whether or not jars should be sampled from cached listings only, without contacting the repository
+# (directories that are not cached are treated as empty)
+offline = false
+# local path or url of an index of the repository: when provided, jars are sampled uniformly
+# from the index instead of randomly walking the directory listings (files ending with .gz
+# are decompressed on the fly)
+index = 
+# format of the index, one of:
+# - list: one jar path (relative to the repository root) or url per line
+# - nexus: a Maven Indexer index (e.g. https://repo1.maven.org/maven2/.index/nexus-maven-repository-index.gz)
+index_format = list
+'''
+        template_loc = self.make_file(self.conf_template_filename)
+        with open(template_loc, 'w') as f:
+            f.write(template)
+            
+        return template_loc
+        
+    def read_conf(self, config):
+        # the configuration is optional: missing entries keep their defaults
+        crawler = config['crawler'] if config.has_section('crawler') else dict()
+        self.set_repository(crawler.get('repository', '') or self.mvn_base)
+        self.listing_cache = base.strtobool(crawler.get('listing_cache', 'true'))
+        self.listing_ttl = float(crawler.get('listing_ttl', '24'))
+        self.offline = base.strtobool(crawler.get('offline', 'false'))
+        self.index = crawler.get('index', '')
+        self.index_format = crawler.get('index_format', 'list') or 'list'
+        
+        if self.index_format not in ['list', 'nexus']:
+            raise Exception('Unknown index format: ' + self.index_format)        
+        if self.offline and not self.listing_cache:
+            raise Exception('Offline sampling requires the listing cache')
 
     def page_links(self, page_url):
-        result = []
+        return self.listings.get(page_url, self.load_links)
         
-        response = requests.get(page_url)
+    def load_links(self, page_url):
+        cached = None
+        if self.disk_listings:
+            cached = self.disk_listings.lookup(page_url)
+            
+        if cached:
+            self.metrics.increment('listing_disk_cache', result = 'hit')
+        elif self.disk_listings:
+            self.metrics.increment('listing_disk_cache', result = 'miss')
+        if self.offline:
+            # directories that have never been cached are dead ends
+            return cached.links if cached else ()
+        if cached and time.time() - cached.fetched < self.listing_ttl * 3600:
+            return cached.links
+        
+        headers = dict()
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        
+        # listings are parsed while they are received
+        response = self.get(page_url, headers = headers, stream = True)
+        if cached and response.status_code == 304:
+            # the listing did not change since the last time it was fetched
+            response.close()
+            self.disk_listings.touch(page_url)
+            self.metrics.increment('listing_revalidations', status = 'unchanged')
+            return cached.links
+        if cached:
+            self.metrics.increment('listing_revalidations', status = 'changed')
         if not response.ok:
+            response.close()
             response.raise_for_status()
+            
+        with response:
+            links = self.parse_links(page_url, response.iter_content(64 * 1024))
+        if self.disk_listings:
+            self.disk_listings.store(page_url, links, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return links
         
-        for anchor in BeautifulSoup(response.content, features='html.parser').find_all('a', href = True):
-            link = anchor['href']
+    def parse_links(self, page_url, chunks):
+        result = []
+        
+        for link in iter_hrefs(chunks):
             # a link is valid if it is a directory link, but not '../', or a jar link
             if link == '../' or link.endswith('-javadoc.jar') or link.endswith('-sources.jar'):
                 continue
@@ -42,17 +144,20 @@ class MvnRandom(base.Crawler):
                 
         return result
         
-    def random_jar(self, base_url):
-        links = self.page_links(base_url)
+    def random_jar(self, base_url, rng):
+        # the cached listing is shared: work on a copy since dead ends are removed from it
+        # jars belonging to other shards are left to them, so that shards never crawl the same jar: folders 
+        # containing only such jars are dead ends for this shard
+        links = [link for link in self.page_links(base_url) if not link.endswith('.jar') or self.owns(link[len(self.mvn_base):])]
 
         while len(links) > 0:
-            link = random.choice(links)
+            link = rng.choice(links)
 
             if link.endswith('.jar'):
                 return link
         
             # at this point, link is a folder
-            inner = self.random_jar(link)
+            inner = self.random_jar(link, rng)
             if not inner:
                 # link is a folder that does not lead to a jar file:
                 # ignore it and try with a different link
@@ -63,37 +168,104 @@ class MvnRandom(base.Crawler):
                 
         return None
     
-    def get_jar_url(self, base_url):
-        result = self.random_jar(base_url)
+    def get_jar_url(self, base_url, rng):
+        result = self.random_jar(base_url, rng)
         if result:
             return result[len(self.mvn_base):], result
 
         raise Exception('Scanning "' + base_url + '" did not lead to any jar file')
 
-    def crawl(self):
-        crawled = 0
-        print('Will crawl ' + str(self.limit) + ' jars', flush = True)
+    def sample_jar(self, i):
+        # each sample has its own generator: samples are reproducible with a seed, whatever the order they are drawn in
+        rng = make_rng(self.seed, self.shard_name(), i)
+        with self.metrics.timed('walk_seconds'):
+            return self.get_jar_url(rng.choice(self.sources), rng)
+
+    def stream_url(self, url):
+        response = self.get(url, stream = True)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+        
+    def load_index(self):
+        from tqdm import tqdm
         
+        index = JarIndex()
+        with open_index(self.index, self.stream_url) as stream:
+            if self.index_format == 'nexus':
+                paths = read_nexus_index(stream)
+            else:
+                paths = read_jar_list(stream, self.mvn_base)
+            for path in tqdm(paths, ascii = True, desc = 'Reading index', unit = 'jar'):
+                index.add(path)
+        return index
+        
+    def sample_index(self):
+        index = self.load_index()
+        print('Indexed jars: ' + str(len(index)), flush = True)
+        
+        # all shards draw the same sample, each one keeping its own share of it
         to_crawl = dict()
-        for i in tqdm(range(self.limit), ascii = True, desc = 'Searching for jar files', unit = 'jar'):
-            base_url = random.choice(self.sources)
-            jar_name, jar_url = self.get_jar_url(base_url)
-            to_crawl[jar_name] = jar_url
-        print("", flush = True)
+        for jar_name in index.sample(self.limit, make_rng(self.seed, 'index')):
+            if self.owns(jar_name):
+                to_crawl[jar_name] = self.mvn_base + jar_name
+        return to_crawl
         
-        result = []
-        for jar_name, jar_url in to_crawl.items():
-            if self.exists(jar_name) and self.skip_existing:
-                target = self.get_path(jar_name)
+    def sample_walks(self):
+        from tqdm import tqdm
+        
+        if self.listing_cache:
+            self.disk_listings = DiskListingCache(self.get_path(self.listing_cache_filename))
+        if self.offline:
+            print('Sampling offline from the listing cache', flush = True)
+        
+        samples = share(self.shard, self.limit)
+        with ThreadPoolExecutor(max_workers = self.jobs) as executor:
+            walks = [executor.submit(self.sample_jar, i) for i in range(samples)]
+            for walk in tqdm(as_completed(walks), total = samples, ascii = True, desc = 'Searching for jar files', unit = 'jar'):
+                pass
+        
+        # jars are crawled in the order of the samples, that does not depend on the order walks completed in
+        to_crawl = dict()
+        for walk in walks:
+            try:
+                jar_name, jar_url = walk.result()
+                to_crawl[jar_name] = jar_url
+            except Exception as e:
+                self.failures.append(('random walk', e))
+        print("", flush = True)
+        print('Fetched listings: ' + str(self.listings.misses) + ' (reused: ' + str(self.listings.hits) + ')', flush = True)
+        self.metrics.set('listing_memory_cache', self.listings.hits, result = 'hit')
+        self.metrics.set('listing_memory_cache', self.listings.misses, result = 'miss')
+        return to_crawl
+
+    def iter_crawl(self):
+        if self.shard and self.seed is None:
+            raise Exception('Sharded sampling needs a seed, shared by all shards')
+        if self.shard:
+            print('Shard: ' + self.shard_name(), flush = True)
+        print('Will crawl ' + str(share(self.shard, self.limit)) + ' jars', flush = True)
+        with self.metrics.stage('sample'):
+            if self.index:
+                to_crawl = self.sample_index()
             else:
+                to_crawl = self.sample_walks()
+        
+        yield from self.iter_retrieve_all(self.retrieve, list(to_crawl.items()), lambda jar : jar[0])
+        
+    def retrieve(self, jar):
+        jar_name, jar_url = jar
+        sequential = self.live_progress
+        
+        def download(target):
+            if sequential:
                 print('- ' + jar_name, end = '', flush = True)
-                zip_response = requests.get(jar_url, stream = True)
-                target = self.make_file(jar_name)
-                with open(target, 'wb') as handle:
-                    for data in tqdm(zip_response.iter_content(), ascii = True, desc='  downloading'):
-                        handle.write(data)
-            result.append(target)
-            print("", flush = True)
+            # maven repositories publish the SHA-1 checksum of each file
+            checksum = download_file(self.get, jar_url, target, progress = sequential, sha1_url = jar_url + '.sha1')
+            if sequential:
+                print("", flush = True)
+            else:
+                print('- ' + jar_name + ': downloaded', flush = True)
+            return checksum
             
-        return result
-
+        return [self.retrieve_item(jar_name, jar_url, download)]
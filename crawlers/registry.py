@@ -0,0 +1,64 @@
+import importlib
+
+# built-in crawlers, as 'module:class' references: modules are imported only when their crawler is selected
+CRAWLERS = {
+    'github' : 'crawlers.github:GitHubCrawler',
+    'mvn-rand' : 'crawlers.mvn_rand:MvnRandom',
+}
+
+# entry point group through which installed packages can provide additional crawlers
+ENTRY_POINT_GROUP = 'code_crawler.crawlers'
+
+def import_reference(reference):
+    module, _, name = reference.partition(':')
+    if not name:
+        raise Exception('Invalid crawler reference: ' + reference + ' (expected module:class)')
+    return getattr(importlib.import_module(module), name)
+
+def plugin_entry_points():
+    # package metadata is scanned only when needed, e.g. for names that are not built-in
+    from importlib.metadata import entry_points
+    found = entry_points()
+    if hasattr(found, 'select'):
+        return found.select(group = ENTRY_POINT_GROUP)
+    # python < 3.10
+    return found.get(ENTRY_POINT_GROUP, [])
+
+def entry_point(name):
+    for candidate in plugin_entry_points():
+        if candidate.name == name:
+            return candidate
+    return None
+
+def load(name):
+    """Loads the class of a crawler, importing only its module (and the dependencies of that module).
+
+    Crawlers are looked up among the built-in ones, then as a 'module:class' reference (with the module
+    importable from the python path), and finally among the entry points of the 'code_crawler.crawlers'
+    group of the installed packages.
+
+    A crawler class is constructed with the limit, the workdir, whether existing items are skipped,
+    and the keyword options of crawlers.base_crawler.Crawler.
+
+    Parameters:
+    - name: the name of the crawler, or a 'module:class' reference
+
+    Returns: the class of the crawler
+    """
+
+    if name in CRAWLERS:
+        return import_reference(CRAWLERS[name])
+    if ':' in name:
+        return import_reference(name)
+    found = entry_point(name)
+    if found:
+        return found.load()
+    raise Exception('Unknown crawler: ' + name + ' (available: ' + ', '.join(available()) + ')')
+
+def available():
+    """Yields the names of all available crawlers: the built-in ones and the ones provided by entry points.
+
+    Returns: sorted list of names
+    """
+
+    return sorted(set(CRAWLERS) | set(candidate.name for candidate in plugin_entry_points()))
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from crawlers.store import file_digest
+
+class ResultCache:
+    def __init__(self, path, max_entries):
+        """Opens (or creates) a persistent cache of the results of commands executed on crawled items, backed by a SQLite database.
+
+        Results are keyed by the command and the checksum of the content of the item it has been executed on,
+        so that a command is not executed again on an item that did not change. The least recently used
+        results are evicted when the cache grows over its maximum size.
+
+        Checksums are also cached, keyed by the path, size and modification time of files, to avoid hashing
+        unchanged files over and over.
+
+        Parameters:
+        - path:        the path of the database file
+        - max_entries: the maximum number of results kept in the cache
+        """
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok = True)
+        # the connection is shared among the executing threads, with accesses serialized by the lock
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results (command TEXT, digest TEXT, exit_code INTEGER, status TEXT, duration REAL, output BLOB, used REAL, PRIMARY KEY (command, digest))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, digest TEXT)')
+        self.db.commit()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def file_digest(self, path, pending = None):
+        stat = os.stat(path)
+        with self.lock:
+            row = self.db.execute('SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime = ?', (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+
+        digest = file_digest(path)
+        if pending is not None:
+            # written later by the caller, along with the other checksums of the same content
+            pending.append((path, stat.st_size, stat.st_mtime_ns, digest))
+        else:
+            self.store_digests([(path, stat.st_size, stat.st_mtime_ns, digest)])
+        return digest
+
+    def store_digests(self, rows):
+        # a single transaction for all the rows, since each commit might wait for the disk
+        if rows:
+            with self.lock:
+                self.db.executemany('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)', rows)
+                self.db.commit()
+
+    def member_digest(self, member):
+        """Computes the checksum of the content of an archive member, caching it along with the size and
+        modification time of the archive.
+
+        Parameters:
+        - member: the ArchiveMember
+
+        Returns: the checksum, as a lowercase hex string
+        """
+
+        stat = os.stat(member.archive)
+        with self.lock:
+            row = self.db.execute('SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime = ?', (str(member), stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+
+        digest = member.digest()
+        self.store_digests([(str(member), stat.st_size, stat.st_mtime_ns, digest)])
+        return digest
+
+    def content_digest(self, path):
+        """Computes the checksum of the content of a file or directory.
+
+        The checksum of a directory covers the relative paths and contents of all its files, except
+        for the ones in version control directories.
+
+        Parameters:
+        - path: the path of the file or directory
+
+        Returns: the checksum, as a lowercase hex string
+        """
+
+        if not os.path.isdir(path):
+            return self.file_digest(path)
+
+        digest = hashlib.sha256()
+        pending = []
+        try:
+            for dirpath, subdirs, filelist in os.walk(path):
+                subdirs[:] = sorted(d for d in subdirs if d not in ('.git', '.hg', '.svn', '.bzr'))
+                for name in sorted(filelist):
+                    full = os.path.join(dirpath, name)
+                    if os.path.isfile(full):
+                        digest.update(os.path.relpath(full, path).encode('utf-8', errors = 'surrogateescape') + b'\0')
+                        digest.update(self.file_digest(full, pending).encode('ascii') + b'\0')
+        finally:
+            # checksums computed before a failure are still valid
+            self.store_digests(pending)
+        return digest.hexdigest()
+
+    def lookup(self, command, digest):
+        """Yields the cached result of a command on a content, marking it as recently used.
+
+        Parameters:
+        - command: the command
+        - digest:  the checksum of the content
+
+        Returns: the result (a dictionary with exit code, status, duration and output, if captured), or None if not cached
+        """
+
+        with self.lock:
+            row = self.db.execute('SELECT exit_code, status, duration, output FROM results WHERE command = ? AND digest = ?', (command, digest)).fetchone()
+            if not row:
+                return None
+            self.db.execute('UPDATE results SET used = ? WHERE command = ? AND digest = ?', (time.time(), command, digest))
+            self.db.commit()
+        return { 'exit_code' : row[0], 'status' : row[1], 'duration' : row[2], 'output' : row[3] }
+
+    def store(self, command, digest, result):
+        """Caches the result of a command on a content.
+
+        Parameters:
+        - command: the command
+        - digest:  the checksum of the content
+        - result:  the result, as returned by lookup
+        """
+
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (command, digest, result['exit_code'], result['status'], result['duration'], result.get('output'), time.time()))
+            self.db.commit()
+
+    def evict(self):
+        """Evicts the least recently used results exceeding the maximum size of the cache.
+
+        Returns: the number of evicted results
+        """
+
+        with self.lock:
+            count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            if count <= self.max_entries:
+                return 0
+            self.db.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY used LIMIT ?)', (count - self.max_entries,))
+            self.db.commit()
+            return count - self.max_entries
+
+    def close(self):
+        with self.lock:
+            self.db.close()
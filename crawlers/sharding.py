@@ -0,0 +1,68 @@
+import hashlib
+import random
+
+def parse_shard(value):
+    """Parses a shard in the form 'i/N', where N is the number of shards and i (from 0 to N - 1) is the index of the shard.
+
+    Parameters:
+    - value: the string to parse
+
+    Returns: pair of the index and of the number of shards
+    """
+
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise Exception('Invalid shard: ' + value + ' (expected i/N, e.g. 0/4)')
+    if count < 1 or index < 0 or index >= count:
+        raise Exception('Invalid shard: ' + value + ' (expected i/N, with 0 <= i < N)')
+    return index, count
+
+def stable_hash(key):
+    # unlike hash(), the same on all nodes and across executions
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+
+def owns(shard, key):
+    """Yields whether an item belongs to a shard: items are assigned to shards by a stable hash of their key,
+    so that shards are disjoint and cover all items.
+
+    Parameters:
+    - shard: pair of the index and of the number of shards, or None if the crawl is not sharded
+    - key:   the key of the item (e.g. the full name of a repository, or the path of a jar)
+
+    Returns: True if the item belongs to the shard, False otherwise
+    """
+
+    return not shard or stable_hash(key) % shard[1] == shard[0]
+
+def share(shard, total):
+    """Yields the number of items that a shard should sample, splitting the total among the shards.
+
+    Parameters:
+    - shard: pair of the index and of the number of shards, or None if the crawl is not sharded
+    - total: the total number of items to sample
+
+    Returns: the number of items for the shard
+    """
+
+    if not shard:
+        return total
+    index, count = shard
+    return total // count + (1 if index < total % count else 0)
+
+def make_rng(seed, *scope):
+    """Creates a random generator for a given scope (e.g. a shard and the number of a sample).
+
+    Generators of different scopes are independent, and they are reproducible if a seed is given: random choices
+    thus do not depend on the order concurrent tasks are executed in.
+
+    Parameters:
+    - seed:  the seed of the crawl, or None for a non reproducible generator
+    - scope: values identifying the scope
+
+    Returns: a random.Random instance
+    """
+
+    if seed is None:
+        return random.Random()
+    return random.Random(':'.join(str(part) for part in (seed,) + scope))
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+
+def file_digest(path, chunk_size = 1024 * 1024):
+    """Computes the SHA-256 checksum of a file.
+
+    Parameters:
+    - path:       the path of the file
+    - chunk_size: the number of bytes read at a time
+
+    Returns: the checksum, as a lowercase hex string
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for data in iter(lambda : handle.read(chunk_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+class BlobStore:
+    def __init__(self, root):
+        """Opens (or creates) a content-addressed store of crawled files.
+
+        Each distinct content is kept once, as a blob named after its SHA-256 checksum: crawled files
+        with the same content are turned into hardlinks to the same blob, so that duplicates take no
+        additional space (crawled files must thus not be modified in place). An index, in json lines format,
+        records the paths that have been stored with each checksum.
+
+        Parameters:
+        - root: the directory of the store, that must be on the same file system of the crawled files
+        """
+
+        self.root = root
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.report_path = os.path.join(root, 'duplicates.json')
+        # checksum -> set of absolute paths, and the inverse mapping
+        self.paths = dict()
+        self.digests = dict()
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok = True)
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.record(entry['path'], entry['digest'])
+        self.index = open(self.index_path, 'a')
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest[2:])
+
+    def record(self, path, digest):
+        previous = self.digests.get(path)
+        if previous:
+            self.paths[previous].discard(path)
+        self.digests[path] = digest
+        self.paths.setdefault(digest, set()).add(path)
+
+    def add(self, path, digest = None):
+        """Adds a file to the store, replacing it with a hardlink to the blob with the same content, if any.
+
+        Parameters:
+        - path:   the path of the file
+        - digest: the SHA-256 checksum of the file, if already known (e.g. computed while downloading it)
+
+        Returns: True if the content of the file was already in the store, False otherwise
+        """
+
+        path = os.path.abspath(path)
+        digest = digest or file_digest(path)
+        blob = self.blob_path(digest)
+
+        with self.lock:
+            duplicate = os.path.isfile(blob)
+            try:
+                if not duplicate:
+                    os.makedirs(os.path.dirname(blob), exist_ok = True)
+                    os.link(path, blob)
+                elif not os.path.samefile(path, blob):
+                    # the link is created next to the file and then moved over it, to never lose the file
+                    temp = path + '.link'
+                    os.link(blob, temp)
+                    os.replace(temp, path)
+            except OSError as e:
+                # e.g. the store is on a different file system: the content is still indexed
+                print('- cannot link ' + path + ' to the store (' + str(e) + ')', flush = True)
+
+            self.record(path, digest)
+            self.index.write(json.dumps({ 'path' : path, 'digest' : digest }) + '\n')
+            self.index.flush()
+        return duplicate
+
+    def add_tree(self, root, skip = ('.git',)):
+        """Adds all the regular files inside a directory to the store.
+
+        Parameters:
+        - root: the path of the directory
+        - skip: names of directories whose content is not stored
+
+        Returns: the number of files whose content was already in the store
+        """
+
+        duplicates = 0
+        for dirpath, subdirs, filelist in os.walk(root):
+            subdirs[:] = [d for d in subdirs if d not in skip]
+            for name in filelist:
+                path = os.path.join(dirpath, name)
+                if os.path.isfile(path) and not os.path.islink(path) and self.add(path):
+                    duplicates += 1
+        return duplicates
+
+    def duplicates(self):
+        """Yields the contents that have been stored more than once.
+
+        Returns: dictionary from the checksum of each duplicated content to the sorted list of paths holding it
+        """
+
+        with self.lock:
+            return { digest : sorted(paths) for digest, paths in self.paths.items() if len(paths) > 1 }
+
+    def write_report(self):
+        """Writes the duplicates report, in json format, inside the store.
+
+        Returns: pair of the path of the report and the number of duplicated contents
+        """
+
+        duplicates = self.duplicates()
+        with open(self.report_path, 'w') as f:
+            json.dump(duplicates, f, indent = 2)
+        return self.report_path, len(duplicates)
+
+    def close(self):
+        with self.lock:
+            self.index.close()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawlers.base_crawler import Crawler
+
+class RetrieveItemTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.fetched = []
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def crawler(self, skip_existing = False):
+        crawler = Crawler(1, self.workdir, False, skip_existing)
+        self.addCleanup(crawler.close)
+        return crawler
+
+    def fetch(self, content):
+        def fetch(target):
+            # leftovers have been deleted before retrieving the item again (without prompting)
+            self.assertFalse(os.path.lexists(target))
+            self.fetched.append(target)
+            with open(target, 'w') as f:
+                f.write(content)
+            return 'checksum'
+        return fetch
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(os.path.join(self.workdir, path)), exist_ok = True)
+        with open(os.path.join(self.workdir, path), 'w') as f:
+            f.write(content)
+
+    def test_retrieve(self):
+        crawler = self.crawler()
+        target = crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        self.assertEqual(self.fetched, [target])
+        self.assertTrue(crawler.is_crawled('a/item.jar'))
+        record = crawler.get_manifest().lookup('a/item.jar')
+        self.assertEqual((record['status'], record['size'], record['checksum']), ('complete', len('content'), 'checksum'))
+
+    def test_items_without_record(self):
+        # e.g. retrieved before the manifest was introduced
+        self.write('a/item.jar', 'content')
+        self.assertTrue(self.crawler().is_crawled('a/item.jar'))
+        self.assertFalse(self.crawler().is_crawled('a/missing.jar'))
+
+    def test_interrupted_retrieval(self):
+        crawler = self.crawler(skip_existing = True)
+        crawler.get_manifest().add('a/item.jar', 'http://repo/item.jar', 'started')
+        self.write('a/item.jar', 'partial')
+        self.assertFalse(crawler.is_crawled('a/item.jar'))
+
+        crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        self.assertEqual(len(self.fetched), 1)
+        with open(os.path.join(self.workdir, 'a/item.jar')) as f:
+            self.assertEqual(f.read(), 'content')
+
+    def test_interrupted_clone(self):
+        crawler = self.crawler(skip_existing = True)
+        crawler.get_manifest().add('owner/repo', 'http://git/owner/repo', 'started')
+        self.write('owner/repo/README', 'partial')
+        self.assertFalse(crawler.is_crawled('owner/repo'))
+
+        crawler.retrieve_item('owner/repo', 'http://git/owner/repo', self.fetch('content'), kind = 'clone')
+        self.assertEqual(len(self.fetched), 1)
+
+    def test_truncated_file(self):
+        crawler = self.crawler(skip_existing = True)
+        crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        self.write('a/item.jar', 'cont')
+        self.assertFalse(crawler.is_crawled('a/item.jar'))
+
+        crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        self.assertEqual(len(self.fetched), 2)
+        self.assertTrue(crawler.is_crawled('a/item.jar'))
+
+    def test_skip_existing(self):
+        crawler = self.crawler(skip_existing = True)
+        crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        target = crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', self.fetch('content'))
+        self.assertEqual(self.fetched, [target])
+
+    def test_failed_retrieval(self):
+        crawler = self.crawler()
+        def fail(target):
+            raise Exception('connection reset')
+        with self.assertRaises(Exception):
+            crawler.retrieve_item('a/item.jar', 'http://repo/item.jar', fail)
+        record = crawler.get_manifest().lookup('a/item.jar')
+        self.assertEqual((record['status'], record['error']), ('failed', 'connection reset'))
+        self.assertFalse(crawler.is_crawled('a/item.jar'))
+
+if __name__ == '__main__':
+    unittest.main()
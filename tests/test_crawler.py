@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawler import execute_cached, unique_contents
+from crawlers.result_cache import ResultCache
+from crawlers.store import BlobStore
+
+class ExecuteCachedTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.root, 'cache.sqlite'), 100)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.root)
+
+    def test_dangling_symlink_is_executed_but_not_cached(self):
+        regular = os.path.join(self.root, 'a.txt')
+        with open(regular, 'w') as handle:
+            handle.write('a')
+        dangling = os.path.join(self.root, 'broken')
+        os.symlink(os.path.join(self.root, 'missing'), dangling)
+
+        for run in range(2):
+            results = dict(execute_cached('true', [regular], None, self.cache, False, False, None, False) +
+                           execute_cached('true', [dangling], None, self.cache, False, False, None, False))
+            self.assertEqual(results[regular]['status'], 'succeeded')
+            self.assertEqual(results[regular].get('cached', False), run == 1)
+            self.assertEqual(results[dangling]['status'], 'succeeded')
+            self.assertFalse(results[dangling].get('cached', False))
+
+class UniqueContentsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = BlobStore(os.path.join(self.root, 'store'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+
+    def make_tree(self, name, files):
+        root = os.path.join(self.root, name)
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok = True)
+            with open(os.path.join(root, path), 'w') as handle:
+                handle.write(content)
+        self.store.add_tree(root)
+        return root
+
+    def test_deduplicated_directories_are_skipped(self):
+        files = { 'README' : 'readme', os.path.join('src', 'Main.java') : 'class Main {}' }
+        original = self.make_tree('original', files)
+        fork = self.make_tree('fork', files)
+        changed = self.make_tree('changed', dict(files, README = 'changed'))
+        # version control directories differ among forks
+        os.makedirs(os.path.join(fork, '.git'))
+        with open(os.path.join(fork, '.git', 'HEAD'), 'w') as handle:
+            handle.write('ref: refs/heads/main')
+
+        self.assertEqual(list(unique_contents([original, fork, changed])), [original, changed])
+
+    def test_deduplicated_files_are_skipped(self):
+        root = self.make_tree('files', { 'a' : 'same', 'b' : 'same', 'c' : 'other' })
+        paths = [os.path.join(root, name) for name in ('a', 'b', 'c')]
+        self.assertEqual(list(unique_contents(paths)), [paths[0], paths[2]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawlers.download import download, partial_path, validator_path
+
+class FakeResponse:
+    def __init__(self, status_code, content = b'', headers = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = dict(headers or dict(), **{ 'Content-Length' : str(len(content)) })
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception('HTTP ' + str(self.status_code))
+
+    def close(self):
+        pass
+
+class FakeServer:
+    """Serves a single file (and its SHA-1), honoring Range and If-Range requests like a real server."""
+
+    def __init__(self, content, etag = '"v1"', ranges = True):
+        self.content = content
+        self.etag = etag
+        self.ranges = ranges
+        self.sha1 = hashlib.sha1(content).hexdigest()
+        self.requests = []
+
+    def get(self, url, headers = None, stream = False):
+        headers = headers or dict()
+        self.requests.append(headers)
+        if url.endswith('.sha1'):
+            return FakeResponse(200, self.sha1.encode('ascii')) if self.sha1 else FakeResponse(404)
+        validators = { 'ETag' : self.etag } if self.etag else dict()
+        if self.ranges and 'Range' in headers and headers.get('If-Range', self.etag) == self.etag:
+            start = int(headers['Range'][len('bytes='):].rstrip('-'))
+            if start >= len(self.content):
+                return FakeResponse(416)
+            return FakeResponse(206, self.content[start:], validators)
+        return FakeResponse(200, self.content, validators)
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.target = os.path.join(self.root, 'file.jar')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def interrupted(self, content, validator = None):
+        # leftovers of an interrupted download
+        with open(partial_path(self.target), 'wb') as f:
+            f.write(content)
+        if validator:
+            with open(validator_path(self.target), 'w') as f:
+                f.write(validator)
+
+    def assertDownloaded(self, content, checksum):
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(checksum, hashlib.sha256(content).hexdigest())
+        self.assertFalse(os.path.exists(partial_path(self.target)))
+        self.assertFalse(os.path.exists(validator_path(self.target)))
+
+    def test_download(self):
+        server = FakeServer(b'0123456789' * 100)
+        checksum = download(server.get, 'http://repo/file.jar', self.target, sha1_url = 'http://repo/file.jar.sha1')
+        self.assertDownloaded(server.content, checksum)
+        self.assertNotIn('Range', server.requests[0])
+
+    def test_resume_unchanged(self):
+        server = FakeServer(b'0123456789' * 100)
+        self.interrupted(server.content[:300], '"v1"')
+        checksum = download(server.get, 'http://repo/file.jar', self.target)
+        self.assertDownloaded(server.content, checksum)
+        self.assertEqual(server.requests[0], { 'Range' : 'bytes=300-', 'If-Range' : '"v1"' })
+
+    def test_resume_changed(self):
+        # the remote file changed since the interrupted download: the server sends it whole
+        server = FakeServer(b'abcdefghij' * 100, etag = '"v2"')
+        self.interrupted(b'0123456789' * 30, '"v1"')
+        checksum = download(server.get, 'http://repo/file.jar', self.target)
+        self.assertDownloaded(server.content, checksum)
+
+    def test_resume_without_validator(self):
+        # without a validator nor a checksum, a changed remote file cannot be detected: the download starts over
+        server = FakeServer(b'abcdefghij' * 100, etag = None)
+        self.interrupted(b'0123456789' * 30)
+        checksum = download(server.get, 'http://repo/file.jar', self.target)
+        self.assertDownloaded(server.content, checksum)
+        self.assertNotIn('Range', server.requests[0])
+
+    def test_resume_verified_by_checksum(self):
+        server = FakeServer(b'0123456789' * 100, etag = None)
+        self.interrupted(server.content[:300])
+        checksum = download(server.get, 'http://repo/file.jar', self.target, sha1_url = 'http://repo/file.jar.sha1')
+        self.assertDownloaded(server.content, checksum)
+        self.assertIn({ 'Range' : 'bytes=300-' }, server.requests)
+
+    def test_range_not_satisfiable(self):
+        # the partial file is longer than the remote one
+        server = FakeServer(b'0123456789' * 10)
+        self.interrupted(b'0123456789' * 30, '"v1"')
+        checksum = download(server.get, 'http://repo/file.jar', self.target)
+        self.assertDownloaded(server.content, checksum)
+
+    def test_ranges_not_supported(self):
+        server = FakeServer(b'0123456789' * 100, ranges = False)
+        self.interrupted(server.content[:300], '"v1"')
+        checksum = download(server.get, 'http://repo/file.jar', self.target)
+        self.assertDownloaded(server.content, checksum)
+
+    def test_checksum_mismatch(self):
+        server = FakeServer(b'0123456789' * 100)
+        server.sha1 = hashlib.sha1(b'something else').hexdigest()
+        with self.assertRaises(Exception) as raised:
+            download(server.get, 'http://repo/file.jar', self.target, sha1_url = 'http://repo/file.jar.sha1')
+        self.assertIn('Checksum mismatch', str(raised.exception))
+        for path in (self.target, partial_path(self.target), validator_path(self.target)):
+            self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
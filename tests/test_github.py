@@ -0,0 +1,60 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from crawler import compile_globs
+from crawlers.github import GitHubCrawler
+
+FILES = ['src/A.java', 'src/a/B.java', 'lib/src/c/D.java', 'src/E.txt', 'other/F.java', 'G.java']
+
+def git(cwd, *arguments):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(arguments), cwd = cwd, check = True,
+                   stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+@unittest.skipUnless(shutil.which('git'), 'git is not installed')
+class SparsePatternsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.upstream = os.path.join(self.root, 'upstream')
+        for name in FILES:
+            os.makedirs(os.path.dirname(os.path.join(self.upstream, name)), exist_ok = True)
+            with open(os.path.join(self.upstream, name), 'w') as handle:
+                handle.write(name)
+        git(self.upstream, 'init', '-q')
+        git(self.upstream, 'add', '.')
+        git(self.upstream, 'commit', '-q', '-m', 'files')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def sparse_checkout(self, globs):
+        crawler = GitHubCrawler(1, self.root, False, file_filters = globs)
+        crawler.crawler_sparse = True
+        clone = os.path.join(self.root, 'clone')
+        git(self.root, 'clone', '-q', '--no-checkout', self.upstream, clone)
+        git(clone, 'sparse-checkout', 'set', '--no-cone', *crawler.sparse_patterns())
+        git(clone, 'read-tree', '-mu', 'HEAD')
+        return clone, set(os.path.relpath(os.path.join(path, name), clone) for path, dirs, names in os.walk(clone) 
+                          if '.git' not in path.split(os.sep) for name in names)
+
+    def assertChecksOutMatches(self, globs, expected):
+        clone, checked_out = self.sparse_checkout(globs)
+        matches = compile_globs(globs)
+        # all the files selected for --fexec are checked out
+        self.assertEqual(set(name for name in FILES if matches(os.path.abspath(os.path.join(clone, name)))), set(expected))
+        self.assertTrue(set(expected) <= checked_out)
+
+    def test_file_names(self):
+        self.assertChecksOutMatches(['*.java'], ['src/A.java', 'src/a/B.java', 'lib/src/c/D.java', 'other/F.java', 'G.java'])
+
+    def test_nested_paths(self):
+        self.assertChecksOutMatches(['*/src/*.java'], ['src/A.java', 'src/a/B.java', 'lib/src/c/D.java'])
+
+    def test_nested_paths_are_not_checked_out_elsewhere(self):
+        clone, checked_out = self.sparse_checkout(['*/src/*.java'])
+        self.assertEqual(checked_out, set(['src/A.java', 'src/a/B.java', 'lib/src/c/D.java']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import contextlib
+import datetime
+import io
+import random
+import unittest
+
+from crawlers.github_search import MAX_SEARCH_RESULTS, QueryPartitioner, date_ordinal, parse_range
+
+def make_repos(stars, start = '2015-01-01', days = 1000, seed = 0):
+    # a repository for each of the given numbers of stars, created on random days (not after today,
+    # the upper bound of the creation dates)
+    rng = random.Random(seed)
+    first = date_ordinal(start)
+    return [{ 'full_name' : 'owner/repo' + str(i), 'stargazers_count' : count, 'created' : first + rng.randrange(days) }
+            for i, count in enumerate(stars)]
+
+def bounds(value, parse):
+    # the ranges generated by the partitioner: 'a', 'a..b' or 'a..*'
+    if '..' not in value:
+        return parse(value), parse(value)
+    low, high = value.split('..')
+    return parse(low), (None if high == '*' else parse(high))
+
+def matches(repo, qualifiers):
+    for name, key, parse in (('stars', 'stargazers_count', int), ('created', 'created', date_ordinal)):
+        if name in qualifiers:
+            low, high = bounds(qualifiers[name], parse)
+            if repo[key] < low or (high is not None and repo[key] > high):
+                return False
+    return True
+
+class FakeSearch:
+    def __init__(self, repos):
+        self.repos = sorted(repos, key = lambda repo : -repo['stargazers_count'])
+
+    def count(self, qualifiers):
+        found = [repo for repo in self.repos if matches(repo, qualifiers)]
+        return len(found), found[:1]
+
+class ParseRangeTest(unittest.TestCase):
+    def test_bounds(self):
+        self.assertEqual(parse_range('10..20', int), (10, 20))
+        self.assertEqual(parse_range('10..*', int), (10, None))
+        self.assertEqual(parse_range('*..20', int), (None, 20))
+        self.assertEqual(parse_range('>10', int), (11, None))
+        self.assertEqual(parse_range('>=10', int), (10, None))
+        self.assertEqual(parse_range('<20', int), (None, 19))
+        self.assertEqual(parse_range('<=20', int), (None, 20))
+        self.assertEqual(parse_range('15', int), (15, 15))
+        self.assertEqual(parse_range(' ', int), (None, None))
+
+    def test_dates(self):
+        self.assertEqual(parse_range('>2020-01-31', date_ordinal), (datetime.date(2020, 2, 1).toordinal(), None))
+
+    def test_invalid(self):
+        self.assertIsNone(parse_range('many', int))
+        self.assertIsNone(parse_range('2020-13-01..*', date_ordinal))
+
+class QueryPartitionerTest(unittest.TestCase):
+    def partition(self, repos, stars = '', created = ''):
+        search = FakeSearch(repos)
+        partitioner = QueryPartitioner(search.count, stars, created)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            partitions = list(partitioner.partitions(len(repos)))
+        return search, partitions, output.getvalue()
+
+    def assertCovers(self, repos, partitions):
+        found = []
+        for qualifiers, count in partitions:
+            matched = [repo['full_name'] for repo in repos if matches(repo, qualifiers)]
+            self.assertEqual(len(matched), count)
+            self.assertLessEqual(count, MAX_SEARCH_RESULTS)
+            found += matched
+        # partitions are disjoint, and cover all the results
+        self.assertEqual(sorted(found), sorted(repo['full_name'] for repo in repos))
+
+    def test_skewed_stars(self):
+        rng = random.Random(1)
+        repos = make_repos([int(rng.paretovariate(1.2)) - 1 for _ in range(3000)], start = '2010-01-01', days = 3000)
+        search, partitions, warnings = self.partition(repos, stars = '>=0')
+        self.assertCovers(repos, partitions)
+        self.assertEqual(warnings, '')
+        # partitions follow the descending order of stars
+        lows = [bounds(qualifiers['stars'], int)[0] for qualifiers, count in partitions]
+        self.assertEqual(lows, sorted(lows, reverse = True))
+
+    def test_adjacent_bounds(self):
+        # low and high differ by one: the geometric mean must still split the range
+        repos = make_repos([7] * 900 + [8] * 900)
+        search, partitions, warnings = self.partition(repos, stars = '7..8')
+        self.assertCovers(repos, partitions)
+        self.assertEqual([qualifiers['stars'] for qualifiers, count in partitions], ['8..8', '7..7'])
+
+    def test_single_number_of_stars(self):
+        # too many results with the same stars: split on the creation date
+        repos = make_repos([0] * 2500)
+        search, partitions, warnings = self.partition(repos, stars = '0..0')
+        self.assertCovers(repos, partitions)
+        self.assertTrue(all(qualifiers['stars'] == '0' and 'created' in qualifiers for qualifiers, count in partitions))
+        self.assertEqual(warnings, '')
+
+    def test_single_day(self):
+        # a day with too many results cannot be split further: its results are truncated, with a warning
+        repos = make_repos([0] * 1200, days = 1)
+        search, partitions, warnings = self.partition(repos, stars = '0', created = '2015-01-01..2015-01-01')
+        self.assertEqual(partitions, [({ 'stars' : '0', 'created' : '2015-01-01..2015-01-01' }, 1200)])
+        self.assertIn('warning', warnings)
+
+    def test_unbounded_stars(self):
+        # the highest bound is taken from the most starred repository
+        repos = make_repos(list(range(1500)))
+        search, partitions, warnings = self.partition(repos, stars = '>=0')
+        self.assertCovers(repos, partitions)
+        self.assertEqual(bounds(partitions[0][0]['stars'], int)[1], 1499)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import io
+import struct
+import unittest
+
+from crawlers.jar_index import read_nexus_index
+
+def nexus_document(fields):
+    data = struct.pack('>i', len(fields))
+    for name, value in fields.items():
+        name = name.encode('utf-8')
+        value = value.encode('utf-8')
+        data += b'\x00' + struct.pack('>H', len(name)) + name + struct.pack('>i', len(value)) + value
+    return data
+
+def nexus_index(documents):
+    return io.BytesIO(b'\x01' + struct.pack('>q', 0) + b''.join(nexus_document(fields) for fields in documents))
+
+class ReadNexusIndexTest(unittest.TestCase):
+    def test_main_and_classified_artifacts(self):
+        stream = nexus_index([
+            # descriptor
+            { 'DESCRIPTOR' : 'NexusIndex', 'IDXINFO' : '1.0|central' },
+            # main artifact: the extension is only in the 'i' field
+            { 'u' : 'com.google.guava|guava|30.0-jre|NA', 'i' : 'bundle|1603000000000|2000000|1|1|0|jar' },
+            # classified artifacts: the extension is in the 'u' field
+            { 'u' : 'com.google.guava|guava|30.0-jre|tests|jar', 'i' : 'jar|1603000000000|100000|0|0|0|jar' },
+            { 'u' : 'com.google.guava|guava|30.0-jre|sources|jar', 'i' : 'jar|1603000000000|100000|0|0|0|jar' },
+            # not a jar
+            { 'u' : 'com.google.guava|guava-parent|30.0-jre|NA', 'i' : 'pom|1603000000000|1000|0|0|0|pom' },
+        ])
+
+        self.assertEqual(list(read_nexus_index(stream)), [
+            'com/google/guava/guava/30.0-jre/guava-30.0-jre.jar',
+            'com/google/guava/guava/30.0-jre/guava-30.0-jre-tests.jar',
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawlers.result_cache import ResultCache
+from crawlers.store import file_digest
+
+class ContentDigestTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.root, 'cache.sqlite'), 100)
+        self.tree = os.path.join(self.root, 'tree')
+        os.makedirs(os.path.join(self.tree, 'sub'))
+        for name in ('a.txt', os.path.join('sub', 'b.txt')):
+            with open(os.path.join(self.tree, name), 'w') as handle:
+                handle.write(name)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.root)
+
+    def test_checksums_of_files_are_cached(self):
+        digest = self.cache.content_digest(self.tree)
+        rows = dict(self.cache.db.execute('SELECT path, digest FROM digests'))
+        self.assertEqual(rows, { os.path.join(self.tree, name) : file_digest(os.path.join(self.tree, name)) 
+                                 for name in ('a.txt', os.path.join('sub', 'b.txt')) })
+        self.assertEqual(self.cache.content_digest(self.tree), digest)
+
+    def test_content_changes_the_checksum(self):
+        digest = self.cache.content_digest(self.tree)
+        with open(os.path.join(self.tree, 'sub', 'b.txt'), 'a') as handle:
+            handle.write('changed')
+        self.assertNotEqual(self.cache.content_digest(self.tree), digest)
+
+if __name__ == '__main__':
+    unittest.main()